@@ -5,6 +5,7 @@ import os
 
 from qtvcp.core import Info, Status
 from base_canon import BaseCanon
+from tracing import TRACER
 
 INFO = Info()
 STATUS = Status()
@@ -25,9 +26,31 @@ class BaseBackPlot(object):
         self.lathe_option = temp.lower() in ["1", "true", "yes"]
         temp = INFO.get_error_safe_setting("RS274NGC", "PARAMETER_FILE", "linuxcnc.var")
         self.parameter_file = os.path.join(self.config_dir, temp)
-        self.temp_parameter_file = os.path.join(self.parameter_file + '.temp')
+        # one per process, programs may be parsed in parallel
+        self.temp_parameter_file = '{}.{}.temp'.format(self.parameter_file, os.getpid())
         self.last_filename = None
 
+    def read_g5x_offsets(self):
+        # returns {index: (x, y, z, a, b, c, u, v, w, rotation)} for G54 (1) to G59.3 (9)
+        # parameters 5221 - 5230 hold G54, each following system is 20 further on
+        params = dict()
+        try:
+            with open(self.parameter_file) as f:
+                for line in f:
+                    words = line.split()
+                    if len(words) < 2: continue
+                    try:
+                        params[int(words[0])] = float(words[1])
+                    except ValueError:
+                        continue
+        except (IOError, OSError) as e:
+            print("Can't read offsets from {}: {}".format(self.parameter_file, e))
+        offsets = dict()
+        for index in range(1, 10):
+            base = 5221 + (index - 1) * 20
+            offsets[index] = tuple(params.get(base + i, 0.0) for i in range(10))
+        return offsets
+
     def load(self, filename=None, *args, **kwargs):
         # args and kwargs are passed to the canon init method
         filename = filename or self.last_filename
@@ -40,10 +63,17 @@ class BaseBackPlot(object):
 
         # create the object which handles the canonical motion callbacks
         # (straight_feed, straight_traverse, arc_feed, rigid_tap, etc.)
-        self.canon = self.canon_class(*args, **kwargs)
-        if os.path.exists(self.parameter_file):
-            shutil.copy(self.parameter_file, self.temp_parameter_file)
-        self.canon.parameter_file = self.temp_parameter_file
+        with TRACER.span('load', 'load', {'file': filename}):
+            self.canon = self.canon_class(*args, **kwargs)
+            self.parse(filename, self.canon)
+
+    def parse(self, filename, canon):
+        # runs the program through canon, also used for reference programs,
+        # returns the gcode result and the line it stopped at
+        with TRACER.span('parameter file copy', 'load'):
+            if os.path.exists(self.parameter_file):
+                shutil.copy(self.parameter_file, self.temp_parameter_file)
+        canon.parameter_file = self.temp_parameter_file
 
         # Some initialization g-code to set the units and optional user code
         unitcode = "G21"
@@ -53,21 +83,16 @@ class BaseBackPlot(object):
         # call back to the canon with motion commands, and record a history
         # of all the movements.
 
-        result, seq = gcode.parse(filename, self.canon, unitcode, initcode)
-        if result > gcode.MIN_ERROR:
-            msg = gcode.strerror(result)
-            fname = os.path.basename(filename)
-            print("3D plot - Error in {} line {}".format(fname, seq - 1), msg)
-
-        # clean up temp var file and the backup
-        os.unlink(self.temp_parameter_file)
-        os.unlink(self.temp_parameter_file + '.bak')
-
-
-if __name__ == "__main__":
-    from base_canon import PrintCanon
-    INI_FILE = "/home/pi/linuxcnc/configs/vtk_dragon/qtdragon_xyz.ini"
-    NGC_FILE = "/home/pi/linuxcnc/nc_files/test200x200.ngc"
-    gr = BaseBackPlot(INI_FILE, canon=PrintCanon)
-    gr.load(NGC_FILE)
-
+        try:
+            with TRACER.span('gcode.parse', 'load'):
+                result, seq = gcode.parse(filename, canon, unitcode, initcode)
+            if result > gcode.MIN_ERROR:
+                msg = gcode.strerror(result)
+                fname = os.path.basename(filename)
+                print("3D plot - Error in {} line {}".format(fname, seq - 1), msg)
+        finally:
+            # clean up temp var file and the backup, also when the parse failed
+            for name in (self.temp_parameter_file, self.temp_parameter_file + '.bak'):
+                if os.path.exists(name):
+                    os.unlink(name)
+        return result, seq
@@ -20,6 +20,10 @@ class BaseCanon(object):
         self.plane = 1
         self.arcdivision = 64
 
+        # last drilled hole, canned cycle pecks at the same spot are one hole
+        self.last_hole = None
+        self.state = None
+
         # extents
         self.min_extents = [9e99, 9e99, 9e99]
         self.max_extents = [-9e99, -9e99, -9e99]
@@ -70,6 +74,10 @@ class BaseCanon(object):
     def add_path_point(self, line_type, start_point, end_point):
         pass
 
+    def add_marker(self, kind, point, direction=None):
+        # kind is one of 'dwell', 'user', 'toolchange', 'hole' or 'arrow'
+        pass
+
     def comment(self, msg):
         pass
 
@@ -182,6 +190,7 @@ class BaseCanon(object):
 
     def change_tool(self, pocket):
         self.first_move = True
+        self.add_marker('toolchange', self.last_pos)
 
     def get_tool(self, pocket):
         return -1, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0
@@ -205,6 +214,7 @@ class BaseCanon(object):
         pos += self.last_pos[3:]
 
         self.add_path_point('feed', self.last_pos, pos)
+        self.add_marker('hole', pos)
 
     def set_plane(self, plane):
         self.plane = plane
@@ -240,22 +250,41 @@ class BaseCanon(object):
         pos = self.rotate_and_translate(x, y, z, a, b, c, u, v, w)
 
         self.add_path_point('feed', self.last_pos, pos)
+        if self.in_canned_cycle():
+            self.check_hole(pos)
         self.last_pos = pos
 
     straight_probe = straight_feed
 
+    def in_canned_cycle(self):
+        # G73 and G81 - G89, motion modes are reported as gcode * 10
+        if self.state is None:
+            return False
+        mode = self.state.motion_mode
+        return mode == 730 or 810 <= mode <= 890
+
+    def check_hole(self, pos):
+        # a plunge straight down marks a hole, pecks at the same spot are ignored
+        last = self.last_pos
+        if pos[0] != last[0] or pos[1] != last[1] or pos[2] >= last[2]:
+            return
+        hole = (self.seq_num, pos[0], pos[1])
+        if hole != self.last_hole:
+            self.last_hole = hole
+            self.add_marker('hole', pos)
+
     def user_defined_function(self, i, p, q):
         if self.suppress > 0:
             return
 
-        self.add_path_point('user', self.last_pos, self.last_pos)
+        self.add_marker('user', self.last_pos)
 
     def dwell(self, arg):
         if self.suppress > 0:
             return
 
         self.dwell_time += arg
-        self.add_path_point('dwell', self.last_pos, self.last_pos)
+        self.add_marker('dwell', self.last_pos)
 
     def get_external_angular_units(self):
         return 1.0
@@ -283,6 +312,7 @@ class StatCanon(BaseCanon):
         self.tools = list(self.stat.tool_table)
 
     def change_tool(self, pocket):
+        super(StatCanon, self).change_tool(pocket)
         if self.random:
             self.tools[0] = self.tools[pocket]
             self.tools[pocket] = self.tools[0]
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# Frame times of VTKBackPlot on a big scene. A program is loaded into the
+# backplot, the camera goes through the standard views of VIEW_PRESETS and is
+# orbited, zoomed and panned like with the mouse, then a running program is
+# played back through the 'periodic' status updates. The percentiles of the
+# frame times of each phase are written as JSON.
+#
+# It uses the stand-ins of run_benchmarks.py and the OpenGL that Qt finds.
+# On a machine without a GPU or display, use Mesa in software:
+#
+#   LIBGL_ALWAYS_SOFTWARE=1 xvfb-run -s "-screen 0 1280x1024x24" \
+#       render_benchmark.py --segments 1000000 --output render.json
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+
+import run_benchmarks
+import synthetic
+
+PHASES = ('still', 'orbit', 'zoom', 'pan', 'running')
+
+
+def percentiles(times):
+    import numpy as np
+    if not times:
+        return dict(frames=0)
+    times = np.array(times) * 1000.0
+    return dict(frames=len(times), mean_ms=float(times.mean()), max_ms=float(times.max()),
+                p50_ms=float(np.percentile(times, 50)), p90_ms=float(np.percentile(times, 90)),
+                p99_ms=float(np.percentile(times, 99)))
+
+
+class Player(object):
+    # drives a backplot like the user and the machine would
+    def __init__(self, backplot, application):
+        self.backplot = backplot
+        self.application = application
+        self.times = dict((phase, list()) for phase in PHASES)
+
+    def frame(self, phase, action):
+        start = time.time()
+        action()
+        self.backplot.renderer_window.Render()
+        self.times[phase].append(time.time() - start)
+        self.application.processEvents()
+
+    def interact(self, phase, action, frames):
+        # a mouse drag, decimated frames and one full frame at the end
+        self.backplot.begin_interaction()
+        for i in range(frames):
+            self.frame(phase, action)
+        self.frame('still', self.backplot.end_interaction)
+
+    def views(self, frames):
+        from vtk_backplot import VIEW_PRESETS
+        backplot = self.backplot
+        camera = backplot.camera
+        for name in VIEW_PRESETS:
+            self.frame('still', lambda: backplot.setView(name))
+            self.interact('orbit', lambda: camera.Azimuth(360.0 / frames), frames)
+            self.interact('orbit', lambda: camera.Elevation(90.0 / frames), frames // 4)
+            self.interact('zoom', backplot.zoomIn, frames // 2)
+            self.interact('zoom', backplot.zoomOut, frames // 2)
+            step = camera.GetParallelScale() * 0.02
+
+            def pan():
+                focal_point = camera.GetFocalPoint()
+                position = camera.GetPosition()
+                camera.SetFocalPoint(focal_point[0] + step, focal_point[1] + step, focal_point[2])
+                camera.SetPosition(position[0] + step, position[1] + step, position[2])
+            self.interact('pan', pan, frames)
+
+    def running(self, positions):
+        # the machine follows the program, one position per status poll
+        from qtvcp.core import Status
+        status = Status()
+        backplot = self.backplot
+        for position in positions:
+            status.stat.actual_position = tuple(position) + (0.0,) * 6
+            start = time.time()
+            backplot.periodic_check(status.stat)
+            self.times['running'].append(time.time() - start)
+            self.application.processEvents()
+
+
+def machine_positions(backplot, count):
+    # points along the loaded path, in the units of the machine
+    import numpy as np
+    segments = [actor.get_segments() for actor in backplot.path_actors.values()]
+    segments = np.concatenate([s for s in segments if len(s)] or [np.zeros((1, 6))])
+    index = np.linspace(0, len(segments) - 1, count).astype(int)
+    offset = np.array(backplot.g5x_offset[:3])
+    return segments[index, 3:6] + offset
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the backplot frame times.")
+    parser.add_argument("program", nargs="?", help="program to load, default a synthetic one")
+    parser.add_argument("--segments", type=int, default=100000)
+    parser.add_argument("--mix", choices=synthetic.MIXES, default='mixed')
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--ini", default=os.path.join(run_benchmarks.REPO, 'qtdragon_xyz.ini'))
+    parser.add_argument("--corpus", default=os.path.join(run_benchmarks.HERE, 'corpus'))
+    parser.add_argument("--size", type=int, nargs=2, default=[800, 600])
+    parser.add_argument("--frames", type=int, default=60, help="frames of each camera move")
+    parser.add_argument("--positions", type=int, default=2000, help="status polls of the running program")
+    parser.add_argument("--output", help="JSON file for the results, default stdout")
+    options = parser.parse_args(args)
+
+    inifile = os.path.abspath(options.ini)
+    program = options.program
+    if program is None:
+        if not os.path.isdir(options.corpus):
+            os.makedirs(options.corpus)
+        program = os.path.join(options.corpus, 'synthetic_{}_{}_{}.ngc'.format(
+            options.mix, options.segments, options.seed))
+        if not os.path.isfile(program):
+            synthetic.generate(program, options.segments, options.mix, options.seed)
+    program = os.path.abspath(program)
+
+    run_benchmarks.setup(inifile)
+    from PyQt5.QtWidgets import QApplication
+    application = QApplication.instance() or QApplication([])
+    from vtk_backplot import VTKBackPlot
+    backplot = VTKBackPlot()
+    backplot.resize(*options.size)
+    backplot.show()
+    application.processEvents()
+
+    start = time.time()
+    backplot.load_program(program)
+    application.processEvents()
+    load_time = time.time() - start
+
+    player = Player(backplot, application)
+    player.views(options.frames)
+    backplot.setViewP()
+    player.running(machine_positions(backplot, options.positions))
+
+    capabilities = backplot.renderer_window.ReportCapabilities() or ''
+    report = dict(created=time.strftime('%Y-%m-%dT%H:%M:%S'), python=platform.python_version(),
+                  machine=platform.machine(), program=program, size=options.size,
+                  opengl=[line.strip() for line in capabilities.splitlines()[:4]],
+                  load_seconds=load_time, load_times=dict(backplot.load_times),
+                  peak_rss_mb=run_benchmarks.peak_rss(),
+                  phases=dict((phase, percentiles(times)) for phase, times in player.times.items()))
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# Times the program loading pipeline outside of LinuxCNC. The linuxcnc, gcode
+# and qtvcp modules are replaced by the stand-ins in standins/, the programs
+# come from synthetic.py. Every stage runs in a fresh process, so its peak RSS
+# is its own. The results are written as JSON, --compare prints the change
+# against an earlier run.
+#
+#   run_benchmarks.py --segments 1000 100000 --mix lines arcs --output today.json
+#
+# Stages:
+#   base_canon      parse with BaseCanon, the callback stream alone
+#   vtk_canon       parse with VTKCanon
+#   add_path_point  VTKCanon.add_path_point fed from a recorded stream
+#   draw_lines      VTKCanon.draw_lines of a parsed program
+#   load_program    VTKBackPlot.load_program in an offscreen window
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import multiprocessing
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+STANDINS = os.path.join(HERE, 'standins')
+STAGES = ('base_canon', 'vtk_canon', 'add_path_point', 'draw_lines', 'load_program')
+
+sys.path.insert(0, HERE)
+import synthetic
+
+
+def setup(inifile):
+    # the stand-ins go first, a real linuxcnc install is not used
+    sys.path[:0] = [STANDINS, REPO]
+    os.environ['INI_FILE_NAME'] = inifile
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+
+def peak_rss():
+    # in MB, ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def counting_canon():
+    from base_canon import BaseCanon
+
+    class CountingCanon(BaseCanon):
+        def __init__(self):
+            super(CountingCanon, self).__init__()
+            self.segments = 0
+
+        def add_path_point(self, line_type, start_point, end_point):
+            self.segments += 1
+    return CountingCanon
+
+
+def stage_base_canon(inifile, program):
+    from base_backplot import BaseBackPlot
+    backplot = BaseBackPlot(inifile, canon=counting_canon())
+
+    def run():
+        backplot.load(program)
+        return dict(segments=backplot.canon.segments)
+    return run
+
+
+def stage_vtk_canon(inifile, program):
+    from base_backplot import BaseBackPlot
+    from vtk_backplot import VTKCanon
+    backplot = BaseBackPlot(inifile, canon=VTKCanon)
+
+    def run():
+        backplot.load(program)
+        canon = backplot.canon
+        return dict(memory_used=canon.memory_used, simplification=canon.get_simplification())
+    return run
+
+
+def stage_add_path_point(inifile, program):
+    from base_backplot import BaseBackPlot
+    from vtk_backplot import VTKCanon
+    base = counting_canon()
+
+    class RecordingCanon(base):
+        # untranslated points, like VTKCanon gets them
+        def __init__(self):
+            super(RecordingCanon, self).__init__()
+            self.stream = list()
+
+        def rotate_and_translate(self, *position):
+            return list(position)
+
+        def set_g5x_offset(self, *args):
+            super(RecordingCanon, self).set_g5x_offset(*args)
+            self.stream.append(('set_g5x_offset', args))
+
+        def add_path_point(self, line_type, start_point, end_point):
+            self.stream.append(('add_path_point', (line_type, tuple(start_point), tuple(end_point))))
+
+    backplot = BaseBackPlot(inifile, canon=RecordingCanon)
+    backplot.load(program)
+    stream = backplot.canon.stream
+    canon = VTKCanon()
+
+    def run():
+        for name, args in stream:
+            getattr(canon, name)(*args)
+        return dict(calls=len(stream), memory_used=canon.memory_used)
+    return run
+
+
+def stage_draw_lines(inifile, program):
+    from base_backplot import BaseBackPlot
+    from vtk_backplot import VTKCanon
+    backplot = BaseBackPlot(inifile, canon=VTKCanon)
+    backplot.load(program)
+
+    def run():
+        backplot.canon.draw_lines()
+        cells = sum(actor.get_stats()['cells'] for actor in backplot.canon.get_path_actors().values())
+        return dict(cells=cells)
+    return run
+
+
+def stage_load_program(inifile, program):
+    from PyQt5.QtWidgets import QApplication
+    application = QApplication.instance() or QApplication([])
+    from vtk_backplot import VTKBackPlot
+    backplot = VTKBackPlot()
+    backplot.resize(800, 600)
+    backplot.show()
+
+    def run():
+        backplot.load_program(program)
+        application.processEvents()
+        return dict(load_times=dict(backplot.load_times))
+    return run
+
+
+def run_stage(stage, inifile, program, queue):
+    # runs in a spawned process
+    setup(inifile)
+    result = dict(stage=stage)
+    try:
+        run = globals()['stage_' + stage](inifile, program)
+        result['baseline_rss_mb'] = peak_rss()
+        start = time.time()
+        result.update(run())
+        result['seconds'] = time.time() - start
+        result['peak_rss_mb'] = peak_rss()
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    queue.put(result)
+
+
+def measure(stage, inifile, program, timeout):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_stage, args=(stage, inifile, program, queue))
+    process.start()
+    # a stage may also die in native code, without GL for example
+    result = None
+    deadline = time.time() + timeout
+    while result is None and time.time() < deadline:
+        try:
+            result = queue.get(timeout=1.0)
+        except Exception:
+            if not process.is_alive() and queue.empty():
+                break
+    if result is None:
+        result = dict(stage=stage, error='no result, exit code {}'.format(process.exitcode))
+    process.join(5)
+    if process.is_alive():
+        process.terminate()
+    return result
+
+
+def compare(results, filename):
+    with open(filename) as f:
+        old = dict(((r['stage'], r['mix'], r['segments']), r) for r in json.load(f)['results'])
+    for result in results:
+        before = old.get((result['stage'], result['mix'], result['segments']))
+        if before is None or 'seconds' not in before or 'seconds' not in result:
+            continue
+        sys.stderr.write("{:15} {:10} {:>9}  time {:6.2f}x  peak rss {:6.2f}x\n".format(
+            result['stage'], result['mix'], result['segments'],
+            result['seconds'] / max(before['seconds'], 1e-9),
+            result['peak_rss_mb'] / max(before['peak_rss_mb'], 1e-9)))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the backplot loading pipeline.")
+    parser.add_argument("--segments", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--mix", nargs="+", choices=synthetic.MIXES, default=['mixed'])
+    parser.add_argument("--stage", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--ini", default=os.path.join(REPO, 'qtdragon_xyz.ini'))
+    parser.add_argument("--corpus", default=os.path.join(HERE, 'corpus'),
+                        help="directory for the generated programs, they are reused")
+    parser.add_argument("--timeout", type=float, default=3600.0, help="seconds per stage")
+    parser.add_argument("--output", help="JSON file for the results, default stdout")
+    parser.add_argument("--compare", help="JSON file of an earlier run")
+    options = parser.parse_args(args)
+
+    inifile = os.path.abspath(options.ini)
+    if not os.path.isdir(options.corpus):
+        os.makedirs(options.corpus)
+    results = list()
+    for mix in options.mix:
+        for segments in options.segments:
+            program = os.path.join(options.corpus, 'synthetic_{}_{}_{}.ngc'.format(mix, segments, options.seed))
+            if not os.path.isfile(program):
+                synthetic.generate(program, segments, mix, options.seed)
+            for stage in options.stage:
+                result = measure(stage, inifile, program, options.timeout)
+                result.update(mix=mix, segments=segments)
+                results.append(result)
+                sys.stderr.write("{:15} {:10} {:>9}  {}\n".format(
+                    stage, mix, segments, result.get('error') or
+                    '{:8.3f} s  {:7.1f} MB'.format(result['seconds'], result['peak_rss_mb'])))
+
+    report = dict(created=time.strftime('%Y-%m-%dT%H:%M:%S'), python=platform.python_version(),
+                  machine=platform.machine(), processor=platform.processor(),
+                  cpu_count=multiprocessing.cpu_count(), seed=options.seed, results=results)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+    if options.compare:
+        compare(results, options.compare)
+    return 1 if any('error' in result for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# Stand-in for the gcode module of linuxcnc. parse() runs the small G-code
+# dialect that synthetic.py writes and makes the canon callbacks the real
+# interpreter would make for it, in inch like the real one:
+#   G0 G1 G2 G3 G4 G10L2 G17 G20 G21 G54-G59 G80 G81 G90 M2 M6 M30 F T
+# Unknown words are ignored, so the INI startup code goes through too.
+import re
+import math
+import shutil
+
+MIN_ERROR = 3
+WORD = re.compile(r'([A-Z])\s*([-+]?[0-9]*\.?[0-9]+)')
+COMMENT = re.compile(r'\(.*?\)|;.*')
+# first, second and axial coordinate of the arc planes, 1 = G17
+PLANE_AXES = {1: (0, 1, 2), 2: (1, 2, 0), 3: (2, 0, 1)}
+
+
+class State(object):
+    # the part of the interpreter state the canons look at
+    def __init__(self):
+        self.sequence_number = 0
+        self.motion_mode = 0
+        self.plane = 170
+        self.origin = 1
+        self.units = 21
+
+
+def strerror(result):
+    return "stand-in interpreter error {}".format(result)
+
+
+def arc_to_segments(canon, end_x, end_y, center_x, center_y, rot, end_z, a, b, c, u, v, w, max_segments):
+    first, second, axial = PLANE_AXES.get(canon.plane, PLANE_AXES[1])
+    start = canon.lo
+    end = [0.0] * 9
+    end[first], end[second], end[axial] = end_x, end_y, end_z
+    end[3:] = [a, b, c, u, v, w]
+    end = canon.rotate_and_translate(*end)
+    center = [0.0] * 9
+    center[first], center[second] = center_x, center_y
+    center = canon.rotate_and_translate(*center)
+    theta1 = math.atan2(start[second] - center[second], start[first] - center[first])
+    theta2 = math.atan2(end[second] - center[second], end[first] - center[first])
+    if rot < 0:
+        while theta2 - theta1 > -1e-6:
+            theta2 -= 2 * math.pi
+    else:
+        while theta2 - theta1 < 1e-6:
+            theta2 += 2 * math.pi
+    if rot < -1:
+        theta2 += 2 * math.pi * (rot + 1)
+    if rot > 1:
+        theta2 += 2 * math.pi * (rot - 1)
+    steps = max(3, int(max_segments * abs(theta2 - theta1) / (2 * math.pi)))
+    radius = math.hypot(start[first] - center[first], start[second] - center[second])
+    segments = list()
+    for step in range(1, steps):
+        fraction = step / float(steps)
+        theta = theta1 + (theta2 - theta1) * fraction
+        point = [s + (e - s) * fraction for s, e in zip(start, end)]
+        point[first] = center[first] + radius * math.cos(theta)
+        point[second] = center[second] + radius * math.sin(theta)
+        segments.append(point)
+    segments.append(list(end))
+    return segments
+
+
+def calc_extents(*args):
+    return [0.0] * 3, [0.0] * 3, [0.0] * 3, [0.0] * 3
+
+
+def parse(filename, canon, unitcode, initcode, *args):
+    interpreter = Interpreter(canon)
+    interpreter.execute(initcode)
+    interpreter.execute(unitcode)
+    interpreter.start()
+    seq = 0
+    with open(filename) as f:
+        for seq, line in enumerate(f, 1):
+            if interpreter.execute(line, seq) is False:
+                break
+    # the real interpreter saves the parameters on exit
+    with open(canon.parameter_file, 'a'):
+        pass
+    shutil.copy(canon.parameter_file, canon.parameter_file + '.bak')
+    return 0, seq + 1
+
+
+class Interpreter(object):
+    def __init__(self, canon):
+        self.canon = canon
+        self.state = State()
+        self.scale = 1 / 25.4
+        self.position = [0.0] * 9
+        self.offsets = dict((index, [0.0] * 9) for index in range(1, 10))
+        self.feed = 0.0
+        self.tool = 0
+        # canned cycle retract plane and depth, in program units
+        self.retract = 0.0
+        self.depth = 0.0
+
+    def start(self):
+        self.canon.set_g5x_offset(1, *self.offsets[1])
+        self.canon.set_g92_offset(*[0.0] * 9)
+
+    def execute(self, line, seq=0):
+        line = COMMENT.sub('', line.upper())
+        words = WORD.findall(line)
+        if not words:
+            return True
+        self.state.sequence_number = seq
+        gcodes = [float(value) for letter, value in words if letter == 'G']
+        mcodes = [int(float(value)) for letter, value in words if letter == 'M']
+        values = dict((letter, float(value)) for letter, value in words if letter not in 'GM')
+        self.canon.next_line(self.state)
+
+        for code in gcodes:
+            if code == 20:
+                self.scale = 1.0
+            elif code == 21:
+                self.scale = 1 / 25.4
+            elif code == 17:
+                self.canon.set_plane(1)
+            elif 54 <= code <= 59:
+                self.state.origin = int(code) - 53
+                self.canon.set_g5x_offset(self.state.origin, *self.offsets[self.state.origin])
+            elif code == 10 and values.get('L') == 2:
+                offset = self.offsets[int(values.get('P', 1))]
+                for index, axis in enumerate('XYZ'):
+                    if axis in values:
+                        offset[index] = values[axis] * self.scale
+                if int(values.get('P', 1)) == self.state.origin:
+                    self.canon.set_g5x_offset(self.state.origin, *offset)
+                return True
+            elif code == 4:
+                self.canon.dwell(values.get('P', 0.0))
+                return True
+            elif code == 80:
+                self.state.motion_mode = 0
+            elif code in (0, 1, 2, 3, 81):
+                self.state.motion_mode = int(code * 10)
+
+        if 'F' in values:
+            self.feed = values['F'] * self.scale
+            self.canon.set_feed_rate(self.feed)
+        if 'T' in values:
+            self.tool = int(values['T'])
+        if 6 in mcodes:
+            self.canon.change_tool(self.tool)
+        if 2 in mcodes or 30 in mcodes:
+            return False
+
+        if not any(axis in values for axis in 'XYZA'):
+            return True
+        target = list(self.position)
+        for index, axis in enumerate('XYZA'):
+            if axis in values:
+                target[index] = values[axis] * (self.scale if index < 3 else 1.0)
+        mode = self.state.motion_mode
+        if mode == 0:
+            self.canon.straight_traverse(*target)
+        elif mode == 10:
+            self.canon.straight_feed(*target)
+        elif mode in (20, 30):
+            center_x = self.position[0] + values.get('I', 0.0) * self.scale
+            center_y = self.position[1] + values.get('J', 0.0) * self.scale
+            rot = -1 if mode == 20 else 1
+            self.canon.arc_feed(target[0], target[1], center_x, center_y, rot,
+                                target[2], target[3], 0.0, 0.0, 0.0, 0.0, 0.0)
+        elif mode == 810:
+            self.retract = values.get('R', self.retract / self.scale) * self.scale
+            self.depth = values.get('Z', self.depth / self.scale) * self.scale
+            top = list(target)
+            top[2] = self.retract
+            bottom = list(target)
+            bottom[2] = self.depth
+            self.canon.straight_traverse(*top)
+            self.canon.straight_feed(*bottom)
+            self.canon.straight_traverse(*top)
+            target = top
+        self.position = target
+        return True
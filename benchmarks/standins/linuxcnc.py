@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# Stand-in for the linuxcnc module, only what the backplot and the canons use.
+# The stat values are those of a machine that is on, homed and idle at G54.
+try:
+    from configparser import RawConfigParser
+except ImportError:
+    from ConfigParser import RawConfigParser
+
+MOTION_TYPE_TRAVERSE = 1
+MOTION_TYPE_FEED = 2
+MOTION_TYPE_ARC = 3
+MOTION_TYPE_TOOLCHANGE = 4
+MOTION_TYPE_PROBING = 5
+MOTION_TYPE_INDEXROTARY = 6
+
+MODE_MANUAL = 1
+MODE_AUTO = 2
+MODE_MDI = 3
+
+NO_TOOL = (-1, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0)
+
+
+class ini(object):
+    def __init__(self, filename):
+        # duplicate keys like HALFILE keep the last value, as find() does not
+        self.parser = RawConfigParser(strict=False)
+        self.parser.optionxform = str
+        self.parser.read(filename)
+
+    def find(self, section, key):
+        if self.parser.has_option(section, key):
+            return self.parser.get(section, key).split('#')[0].strip()
+        return None
+
+    def findall(self, section, key):
+        value = self.find(section, key)
+        return [] if value is None else [value]
+
+
+class stat(object):
+    def __init__(self):
+        self.file = ''
+        self.task_mode = MODE_MANUAL
+        self.motion_type = 0
+        self.g5x_index = 1
+        self.g5x_offset = (0.0,) * 9
+        self.g92_offset = (0.0,) * 9
+        self.rotation_xy = 0.0
+        self.actual_position = (0.0,) * 9
+        self.tool_offset = (0.0,) * 9
+        self.tool_in_spindle = 0
+        # tool n in pocket n, like a nonrandom changer with a full table
+        self.tool_table = [NO_TOOL] + [(tool,) + (0.0,) * 9 + (3.0, 0.0, 0.0, 0)
+                                       for tool in range(1, 100)]
+        self.axis_mask = 7
+        self.linear_units = 1.0
+        self.angular_units = 1.0
+        self.block_delete = 0
+        self.axis = tuple(dict(min_position_limit=-1000.0, max_position_limit=1000.0)
+                          for i in range(9))
+
+    def poll(self):
+        pass
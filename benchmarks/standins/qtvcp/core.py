@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# Stand-in for qtvcp.core. Info reads the INI named by INI_FILE_NAME, Status
+# keeps the connected callbacks so a benchmark can emit status signals like
+# 'periodic' itself, Tool answers from an empty tool table.
+import os
+import linuxcnc
+
+
+class Singleton(object):
+    # like the qtvcp ones, every Info() or Status() is the same object
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(Singleton, cls).__new__(cls)
+            cls._instance.setup()
+        return cls._instance
+
+    def __init__(self):
+        pass
+
+
+class Info(Singleton):
+    def setup(self):
+        self.INIPATH = os.environ.get('INI_FILE_NAME', '/dev/null')
+        self.INI = linuxcnc.ini(self.INIPATH)
+        self.PARAMETER_FILE = self.INI.find('RS274NGC', 'PARAMETER_FILE')
+
+    def get_error_safe_setting(self, heading, detail, default=None):
+        result = self.INI.find(heading, detail)
+        return default if result is None else result
+
+
+class Status(Singleton):
+    def setup(self):
+        self.stat = linuxcnc.stat()
+        self.callbacks = dict()
+
+    def connect(self, signal, callback):
+        self.callbacks.setdefault(signal, list()).append(callback)
+
+    def emit(self, signal, *args):
+        for callback in self.callbacks.get(signal, list()):
+            callback(self, *args)
+
+    def is_auto_mode(self):
+        return self.stat.task_mode == linuxcnc.MODE_AUTO
+
+    def is_mdi_mode(self):
+        return self.stat.task_mode == linuxcnc.MODE_MDI
+
+    def get_current_tool(self):
+        return self.stat.tool_in_spindle
+
+
+class Tool(object):
+    def GET_TOOL_INFO(self, toolnum):
+        # tool, pocket, 9 offsets, diameter, front, back, orientation, comment
+        return [toolnum, toolnum] + [0.0] * 13 + ['']
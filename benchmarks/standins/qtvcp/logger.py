@@ -0,0 +1,7 @@
+#!/usr/bin/env python
+# Stand-in for qtvcp.logger, plain python logging.
+import logging
+
+
+def getLogger(name):
+    return logging.getLogger(name)
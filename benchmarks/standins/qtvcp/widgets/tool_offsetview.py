@@ -0,0 +1,6 @@
+#!/usr/bin/env python
+# Stand-in for the qtvcp tool table widget, the backplot only imports it.
+
+
+class ToolOffsetView(object):
+    pass
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# Deterministic synthetic programs for the benchmarks. The same mix, size and
+# seed always give the same file. Sizes count motion lines, an arc is one line
+# here and many segments after the canon.
+#
+#   synthetic.py --segments 100000 --mix mixed out.ngc
+import sys
+import math
+import random
+import argparse
+
+MIXES = ('lines', 'arcs', 'helix', 'drill', 'origins', 'toolchange', 'mixed')
+# work area in mm
+SIZE = 200.0
+DEPTH = -5.0
+SAFE = 5.0
+
+
+class Writer(object):
+    def __init__(self, f, segments, seed):
+        self.f = f
+        self.left = segments
+        self.random = random.Random(seed)
+        self.x = self.y = 0.0
+
+    def write(self, line, motion=True):
+        self.f.write(line + '\n')
+        if motion:
+            self.left -= 1
+
+    def move_to(self, x, y):
+        self.write('G0 Z{:.3f}'.format(SAFE))
+        self.write('G0 X{:.3f} Y{:.3f}'.format(x, y))
+        self.x, self.y = x, y
+
+    def lines(self, count):
+        # a wavy raster, every line a small step
+        self.move_to(self.random.uniform(0, SIZE), self.random.uniform(0, SIZE))
+        self.write('G1 Z{:.3f} F800'.format(DEPTH))
+        step = 0.5
+        for i in range(count):
+            angle = self.random.uniform(-0.3, 0.3) + (0 if (i // 200) % 2 == 0 else math.pi)
+            self.x = min(max(self.x + step * math.cos(angle), 0), SIZE)
+            self.y = min(max(self.y + step * math.sin(angle) + 0.002, 0), SIZE)
+            self.write('G1 X{:.4f} Y{:.4f} Z{:.4f}'.format(
+                self.x, self.y, DEPTH + self.random.uniform(-0.05, 0.05)))
+
+    def arcs(self, count):
+        # chains of quarter circles
+        self.move_to(self.random.uniform(20, SIZE - 20), self.random.uniform(20, SIZE - 20))
+        self.write('G1 Z{:.3f} F600'.format(DEPTH))
+        radius = self.random.uniform(1.0, 10.0)
+        for i in range(count):
+            angle = (i % 4) * math.pi / 2
+            center_x = self.x - radius * math.cos(angle)
+            center_y = self.y - radius * math.sin(angle)
+            end_x = center_x + radius * math.cos(angle + math.pi / 2)
+            end_y = center_y + radius * math.sin(angle + math.pi / 2)
+            self.write('G3 X{:.4f} Y{:.4f} I{:.4f} J{:.4f}'.format(
+                end_x, end_y, center_x - self.x, center_y - self.y))
+            self.x, self.y = end_x, end_y
+
+    def helix(self, count):
+        # full circles stepping down, like a bored hole
+        self.move_to(self.random.uniform(20, SIZE - 20), self.random.uniform(20, SIZE - 20))
+        self.write('G1 Z0 F400')
+        radius = self.random.uniform(2.0, 8.0)
+        for i in range(count):
+            self.write('G2 X{:.4f} Y{:.4f} Z{:.4f} I{:.4f} J0'.format(
+                self.x, self.y, -0.5 * (i % 20 + 1), radius))
+            if i % 20 == 19:
+                self.write('G1 Z0')
+
+    def drill(self, count):
+        # a grid of G81 holes
+        self.move_to(0, 0)
+        self.write('G81 R{:.3f} Z{:.3f} F300'.format(2.0, DEPTH * 2), motion=False)
+        columns = max(1, int(math.sqrt(count)))
+        pitch = SIZE / columns
+        for i in range(count):
+            self.write('X{:.3f} Y{:.3f}'.format((i % columns) * pitch, (i // columns) * pitch))
+        self.write('G80', motion=False)
+
+    def origins(self, count):
+        # the same short path in every work offset
+        for i in range(count):
+            if i % 500 == 0:
+                self.write('G{}'.format(54 + (i // 500) % 6), motion=False)
+                self.move_to(10, 10)
+                self.write('G1 Z{:.3f} F800'.format(DEPTH))
+            self.write('G1 X{:.3f} Y{:.3f}'.format(10 + (i % 50) * 2, 10 + (i % 500) // 50 * 2))
+
+    def toolchange(self, count):
+        # short cuts with a tool change every 100 lines
+        for i in range(0, count, 100):
+            self.write('T{} M6'.format(1 + (i // 100) % 8), motion=False)
+            self.lines(min(100, count - i))
+
+    def work(self, mix, block=1000):
+        if mix == 'mixed':
+            kinds = MIXES[:-1]
+            i = 0
+            while self.left > 0:
+                self.work_kind(kinds[i % len(kinds)], min(block, self.left))
+                i += 1
+        else:
+            while self.left > 0:
+                self.work_kind(mix, min(block, self.left))
+
+    def work_kind(self, kind, count):
+        getattr(self, kind)(max(1, count))
+
+
+def generate(filename, segments, mix='mixed', seed=1):
+    # writes the program, returns its name
+    with open(filename, 'w') as f:
+        writer = Writer(f, segments, seed)
+        writer.write('(synthetic {} program, {} segments, seed {})'.format(mix, segments, seed), False)
+        writer.write('G21 G17 G90 G54', False)
+        for index in range(2, 7):
+            writer.write('G10 L2 P{} X{:.1f} Y{:.1f} Z0'.format(
+                index, (index - 1) % 3 * (SIZE + 20), (index - 1) // 3 * (SIZE + 20)), False)
+        writer.write('T1 M6', False)
+        writer.work(mix)
+        writer.write('G0 Z{:.3f}'.format(SAFE), False)
+        writer.write('M2', False)
+    return filename
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic G-code program.")
+    parser.add_argument("filename")
+    parser.add_argument("--segments", type=int, default=100000)
+    parser.add_argument("--mix", choices=MIXES, default='mixed')
+    parser.add_argument("--seed", type=int, default=1)
+    options = parser.parse_args(args)
+    generate(options.filename, options.segments, options.mix, options.seed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
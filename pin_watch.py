@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# HAL input pins shown in widgets, read once per scheduler tick instead of a
+# signal per pin change. Nothing is done while the pins stay within the
+# deadband of the values last looked at, which also keeps a noisy value at a
+# rounding edge from flipping its label. A watch can turn the pin values into
+# the texts it shows, its update then runs only when one of the texts
+# changed, so nothing shown lags behind its pins. set_text() leaves a label
+# alone when its text is the same.
+#
+#   self.pin_watch = PinWatch(self.h)
+#   self.pin_watch.watch(('spindle_amps', 'spindle_volts'), self.spindle_pwr_changed,
+#                        self.spindle_pwr_texts, 0.05)
+#
+# The update is called with the texts, or with the pin values in the order of
+# the pins when the watch has no texts function. Alarms that should not wait
+# behind a busy tick go in a PinWatch of a higher priority.
+from scheduler import SCHEDULER, PRIORITY_LOW
+
+
+class Watch(object):
+    def __init__(self, pins, update, texts, deadband):
+        self.pins = pins
+        self.update = update
+        self.texts = texts
+        self.deadband = deadband
+        self.values = None
+        self.shown = None
+
+    def check(self, values):
+        if self.values is not None and all(
+                abs(value - last) <= self.deadband for value, last in zip(values, self.values)):
+            return
+        self.values = values
+        shown = tuple(values) if self.texts is None else tuple(self.texts(*values))
+        if shown == self.shown:
+            return
+        self.shown = shown
+        self.update(*shown)
+
+
+class PinWatch(object):
+    def __init__(self, halcomp, name='pin watch', priority=PRIORITY_LOW):
+        self.h = halcomp
+        self.watches = list()
+        self.texts = dict()
+        SCHEDULER.register(name, self.check, priority)
+
+    def watch(self, pins, update, texts=None, deadband=0.0):
+        # texts(*values) gives what update shows, without it any change of
+        # the values is shown, integer pins need no deadband
+        self.watches.append(Watch(tuple(pins), update, texts, deadband))
+
+    def check(self, stat):
+        values = dict()
+        for watch in self.watches:
+            current = list()
+            for pin in watch.pins:
+                if pin not in values:
+                    values[pin] = self.h[pin]
+                current.append(values[pin])
+            watch.check(current)
+
+    def set_text(self, widget, text):
+        if self.texts.get(widget) == text:
+            return
+        self.texts[widget] = text
+        widget.setText(text)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# Checks programs without the GUI. Every program is parsed with BaseBackPlot
+# and a canon that only keeps statistics, the programs are spread over a
+# pool of processes. One JSON object per program is written to stdout, with
+# its extents, soft limit violations, tools, segment counts, estimated run
+# time and parse error.
+#
+#   preflight.py --ini qtdragon_xyz.ini ~/linuxcnc/nc_files/tonight
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import multiprocessing
+
+from base_canon import BaseCanon
+
+PROGRAM_EXTENSIONS = ('.ngc', '.nc', '.tap', '.gcode')
+AXES = 'XYZABCUVW'
+# canon positions are inch, angles are not scaled
+METRIC_SCALE = (25.4, 25.4, 25.4, 1.0, 1.0, 1.0, 25.4, 25.4, 25.4)
+
+
+def read_tool_table(filename, random):
+    # pocket: (tool, diameter) as the interpreter numbers the pockets, a
+    # random changer uses the P word, otherwise the order of the table
+    tools = dict()
+    try:
+        with open(filename) as f:
+            lines = [line.split(';')[0].split() for line in f]
+    except (IOError, OSError):
+        return tools
+    index = 1
+    for words in lines:
+        values = dict()
+        for word in words:
+            try:
+                values[word[0].upper()] = float(word[1:])
+            except (ValueError, IndexError):
+                continue
+        if 'T' not in values:
+            continue
+        pocket = int(values.get('P', index)) if random else index
+        tools[pocket] = (int(values['T']), values.get('D', 0.0))
+        index += 1
+    return tools
+
+
+class PreflightCanon(BaseCanon):
+    def __init__(self, limits, tools, traverse_rate):
+        # limits are (min, max) per axis letter, in inch like the canon
+        super(PreflightCanon, self).__init__()
+        self.limits = limits
+        self.tools = tools
+        self.traverse_rate = traverse_rate
+        self.segments = dict(feed=0, arcfeed=0, traverse=0)
+        self.feed_time = 0.0
+        self.traverse_time = 0.0
+        self.tools_used = list()
+        self.lower = [9e99] * 9
+        self.upper = [-9e99] * 9
+        # (axis, side): first line that goes beyond the limit
+        self.violations = dict()
+
+    def add_path_point(self, line_type, start_point, end_point):
+        self.segments[line_type] = self.segments.get(line_type, 0) + 1
+        length = math.sqrt(sum((e - s) ** 2 for s, e in zip(start_point[:3], end_point[:3])))
+        if line_type == 'traverse':
+            self.traverse_time += length / self.traverse_rate
+        elif self.feedrate > 0:
+            self.feed_time += length / self.feedrate
+        for axis, (low, high) in self.limits.items():
+            index = AXES.index(axis)
+            value = end_point[index]
+            self.lower[index] = min(self.lower[index], value)
+            self.upper[index] = max(self.upper[index], value)
+            if value < low:
+                self.violations.setdefault((axis, 'min'), self.seq_num)
+            elif value > high:
+                self.violations.setdefault((axis, 'max'), self.seq_num)
+
+    def change_tool(self, pocket):
+        super(PreflightCanon, self).change_tool(pocket)
+        tool = self.get_tool(pocket)[0]
+        if tool not in self.tools_used:
+            self.tools_used.append(tool)
+
+    def get_tool(self, pocket):
+        # the tool lengths are measured on the machine, the table has none
+        tool, diameter = self.tools.get(pocket, (-1, 0.0))
+        return tool, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, diameter, 0.0, 0.0, 0
+
+
+def read_settings(inifile):
+    import linuxcnc
+    ini = linuxcnc.ini(inifile)
+    metric = (ini.find("TRAJ", "LINEAR_UNITS") or "metric") in ("mm", "metric")
+    scale = METRIC_SCALE if metric else (1.0,) * 9
+    axes = [axis for axis in AXES if axis in (ini.find("TRAJ", "COORDINATES") or "XYZ").upper()]
+    limits = dict()
+    for axis in axes:
+        low = ini.find("AXIS_" + axis, "MIN_LIMIT")
+        high = ini.find("AXIS_" + axis, "MAX_LIMIT")
+        if low is None or high is None:
+            continue
+        index = AXES.index(axis)
+        limits[axis] = (float(low) / scale[index], float(high) / scale[index])
+    random = int(ini.find("EMCIO", "RANDOM_TOOLCHANGER") or 0)
+    table = os.path.join(os.path.dirname(inifile), ini.find("EMCIO", "TOOL_TABLE") or "tool.tbl")
+    velocity = float(ini.find("TRAJ", "MAX_LINEAR_VELOCITY") or 1.0) / scale[0]
+    return dict(scale=scale, limits=limits, tools=read_tool_table(table, random),
+                traverse_rate=velocity, units="mm" if metric else "inch")
+
+
+def preflight(job):
+    # runs in a worker process, returns the report of one program
+    inifile, filename = job
+    os.environ["INI_FILE_NAME"] = inifile
+    import gcode
+    from base_backplot import BaseBackPlot
+
+    settings = read_settings(inifile)
+    scale = settings['scale']
+    report = dict(file=filename, units=settings['units'])
+    start = time.time()
+    try:
+        backplot = BaseBackPlot(inifile)
+        canon = PreflightCanon(settings['limits'], settings['tools'], settings['traverse_rate'])
+        result, seq = backplot.parse(filename, canon)
+    except Exception as e:
+        report['error'] = dict(message=str(e), line=None)
+        return report
+    if result > gcode.MIN_ERROR:
+        report['error'] = dict(message=gcode.strerror(result), line=seq - 1)
+    extents = dict()
+    for axis in settings['limits']:
+        index = AXES.index(axis)
+        if canon.lower[index] <= canon.upper[index]:
+            extents[axis] = [canon.lower[index] * scale[index], canon.upper[index] * scale[index]]
+    report['extents'] = extents
+    report['limit_violations'] = [
+        dict(axis=axis, side=side, line=line,
+             value=(canon.lower if side == 'min' else canon.upper)[AXES.index(axis)] * scale[AXES.index(axis)],
+             limit=settings['limits'][axis][0 if side == 'min' else 1] * scale[AXES.index(axis)])
+        for (axis, side), line in sorted(canon.violations.items())]
+    report['tools'] = canon.tools_used
+    report['segments'] = canon.segments
+    report['run_time'] = dict(feed=canon.feed_time, traverse=canon.traverse_time,
+                              dwell=canon.dwell_time,
+                              total=canon.feed_time + canon.traverse_time + canon.dwell_time)
+    report['parse_time'] = time.time() - start
+    return report
+
+
+def find_programs(paths):
+    programs = list()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                programs.extend(os.path.join(root, name) for name in sorted(files)
+                                if name.lower().endswith(PROGRAM_EXTENSIONS))
+        else:
+            programs.append(path)
+    return programs
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Check G-code programs against a machine configuration.")
+    parser.add_argument("paths", nargs="+", help="programs or directories of programs")
+    parser.add_argument("--ini", required=True, help="INI file of the machine")
+    parser.add_argument("-j", "--jobs", type=int, default=multiprocessing.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument("--indent", type=int, default=None, help="indent the JSON output")
+    options = parser.parse_args(args)
+
+    inifile = os.path.abspath(options.ini)
+    os.environ["INI_FILE_NAME"] = inifile
+    jobs = [(inifile, os.path.abspath(program)) for program in find_programs(options.paths)]
+    failed = 0
+    pool = multiprocessing.Pool(max(1, options.jobs))
+    try:
+        # reports come in program order, each as soon as it and those before are done
+        for report in pool.imap(preflight, jobs):
+            if report.get('error') or report.get('limit_violations'):
+                failed += 1
+            sys.stdout.write(json.dumps(report, indent=options.indent, sort_keys=True) + "\n")
+            sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
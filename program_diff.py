@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Geometric diff of two programs, given as numpy arrays of segments with one
+# row (x1, y1, z1, x2, y2, z2) per segment. Segments are grouped in cubic
+# buckets by their middle. A bucket with the same content in both programs
+# is unchanged and its segments are not looked at again, the segments of the
+# other buckets are matched through their hashes. Everything is sorting and
+# hashing, there is no pairwise comparison.
+import numpy as np
+
+# region classes
+ADDED = 0
+REMOVED = 1
+CHANGED = 2
+
+FNV_PRIME = np.uint64(1099511628211)
+FNV_OFFSET = np.uint64(14695981039346656037)
+
+
+def hash_rows(rows):
+    # one 64 bit hash per row of an integer array, overflow wraps around
+    hashes = np.full(len(rows), FNV_OFFSET, dtype=np.uint64)
+    for column in np.asarray(rows).T:
+        hashes ^= column.astype(np.uint64)
+        hashes *= FNV_PRIME
+    return hashes
+
+
+def segment_keys(segments, quantum, bucket_size):
+    # hash of every segment, independent of its direction, and its bucket
+    quantized = np.round(segments / quantum).astype(np.int64)
+    start, end = quantized[:, 0:3], quantized[:, 3:6]
+    swap = ((start[:, 0] > end[:, 0])
+            | ((start[:, 0] == end[:, 0]) & (start[:, 1] > end[:, 1]))
+            | ((start[:, 0] == end[:, 0]) & (start[:, 1] == end[:, 1]) & (start[:, 2] > end[:, 2])))
+    lower = np.where(swap[:, None], end, start)
+    upper = np.where(swap[:, None], start, end)
+    keys = hash_rows(np.hstack([lower, upper]))
+    cells = np.floor((segments[:, 0:3] + segments[:, 3:6]) / (2.0 * bucket_size)).astype(np.int64)
+    return keys, hash_rows(cells), cells
+
+
+def chunk_hashes(keys, buckets):
+    # order independent content hash and size of every bucket
+    ids, inverse = np.unique(buckets, return_inverse=True)
+    sums = np.zeros(len(ids), dtype=np.uint64)
+    np.add.at(sums, inverse, keys)
+    counts = np.bincount(inverse, minlength=len(ids))
+    return ids, sums, counts
+
+
+def diff_segments(current, reference, quantum, bucket_size):
+    # Returns a mask of the added segments of current, a mask of the removed
+    # segments of reference, and the cells and classes of the regions that
+    # differ. The cell of a region is its bucket index, bucket_size wide.
+    current_keys, current_buckets, current_cells = segment_keys(current, quantum, bucket_size)
+    reference_keys, reference_buckets, reference_cells = segment_keys(reference, quantum, bucket_size)
+
+    current_ids, current_sums, current_counts = chunk_hashes(current_keys, current_buckets)
+    reference_ids, reference_sums, reference_counts = chunk_hashes(reference_keys, reference_buckets)
+    common, current_index, reference_index = np.intersect1d(
+        current_ids, reference_ids, assume_unique=True, return_indices=True)
+    same = ((current_sums[current_index] == reference_sums[reference_index])
+            & (current_counts[current_index] == reference_counts[reference_index]))
+    unchanged = common[same]
+
+    # only the segments of changed buckets are matched one by one, a
+    # segment is the same when it has the same hash in the same bucket
+    current_open = ~np.isin(current_buckets, unchanged)
+    reference_open = ~np.isin(reference_buckets, unchanged)
+    current_pairs = hash_rows(np.stack([current_buckets[current_open], current_keys[current_open]], axis=1))
+    reference_pairs = hash_rows(np.stack([reference_buckets[reference_open], reference_keys[reference_open]], axis=1))
+    added = np.zeros(len(current), dtype=bool)
+    removed = np.zeros(len(reference), dtype=bool)
+    added[current_open] = ~np.isin(current_pairs, reference_pairs)
+    removed[reference_open] = ~np.isin(reference_pairs, current_pairs)
+
+    # a region with added and removed segments is a change
+    added_ids, added_first = np.unique(current_buckets[added], return_index=True)
+    removed_ids, removed_first = np.unique(reference_buckets[removed], return_index=True)
+    region_ids = np.union1d(added_ids, removed_ids)
+    in_added = np.isin(region_ids, added_ids)
+    in_removed = np.isin(region_ids, removed_ids)
+    classes = np.where(in_added & in_removed, CHANGED, np.where(in_added, ADDED, REMOVED)).astype(np.uint8)
+    cells = np.empty((len(region_ids), 3), dtype=np.int64)
+    cells[in_added] = current_cells[added][added_first][np.searchsorted(added_ids, region_ids[in_added])]
+    only_removed = ~in_added
+    cells[only_removed] = reference_cells[removed][removed_first][
+        np.searchsorted(removed_ids, region_ids[only_removed])]
+    return added, removed, cells, classes
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 import os
+import time
 import hal
-import hal_glib
 from PyQt5 import QtCore, QtWidgets, QtGui
 from PyQt5.QtWebKitWidgets import QWebView, QWebPage
 from qtvcp.widgets.gcode_editor import GcodeEditor as GCODE
@@ -16,6 +16,11 @@ from qtvcp.core import Status, Action, Info, Path
 from qtvcp import logger
 from shutil import copyfile
 from vtk_backplot import VTKBackPlot
+from thumbnailer import Thumbnailer, THUMBNAIL_SIZE
+from tracing import TRACER
+from scheduler import SCHEDULER, PRIORITY_HIGH, PRIORITY_NORMAL
+from pin_watch import PinWatch
+from style_state import StyleState
 
 LOG = logger.getLogger(__name__)
 KEYBIND = Keylookup()
@@ -37,6 +42,16 @@ TAB_SETUP = 8
 TAB_SETTINGS = 9
 TAB_ACCESSORIES = 10
 
+def get_rss_mb():
+    # resident set size of the gui process, the python heap and vtk data
+    # together, the heap alone would need tracemalloc running all the time
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1048576.0
+    except (IOError, OSError, ValueError, IndexError):
+        return 0.0
+
 class HandlerClass:
     def __init__(self, halcomp, widgets, paths):
         self.h = halcomp
@@ -44,7 +59,18 @@ class HandlerClass:
         self.gcodes = GCodes(widgets)
         self.valid = QtGui.QDoubleValidator(-999.999, 999.999, 3)
         self.styleeditor = SSE(widgets, paths)
+        self.style_state = StyleState()
+        KEYBIND.add_call('Key_F11','on_keycall_F11')
         KEYBIND.add_call('Key_F12','on_keycall_F12')
+        # tracing from the start, to see the first program load too
+        setting = INFO.get_error_safe_setting('DISPLAY', 'TRACE_BUFFER', '0')
+        try:
+            trace_buffer = int(setting)
+        except ValueError:
+            LOG.warning("TRACE_BUFFER {} is not a number of spans, tracing is off".format(setting))
+            trace_buffer = 0
+        if trace_buffer > 0:
+            TRACER.start(trace_buffer)
         KEYBIND.add_call('Key_Pause', 'on_keycall_pause')
 
         # some global variables
@@ -71,24 +97,25 @@ class HandlerClass:
                             "action_home_a", "widget_jog_angular", "widget_increments_angular",
                             "a_plus_jogbutton", "a_minus_jogbutton"]
 
-        STATUS.connect('general', self.dialog_return)
-        STATUS.connect('state-on', lambda w: self.enable_onoff(True))
-        STATUS.connect('state-off', lambda w: self.enable_onoff(False))
-        STATUS.connect('mode-manual', lambda w: self.enable_auto(False))
-        STATUS.connect('mode-mdi', lambda w: self.enable_auto(False))
-        STATUS.connect('mode-auto', lambda w: self.enable_auto(True))
-        STATUS.connect('gcode-line-selected', lambda w, line: self.set_start_line(line))
-        STATUS.connect('hard-limits-tripped', self.hard_limit_tripped)
-        STATUS.connect('program-pause-changed', lambda w, state: self.w.btn_spindle_pause.setEnabled(state))
-        STATUS.connect('actual-spindle-speed-changed', lambda w, speed: self.update_rpm(speed))
-        STATUS.connect('user-system-changed', lambda w, data: self.user_system_changed(data))
-        STATUS.connect('metric-mode-changed', lambda w, mode: self.metric_mode_changed(mode))
-        STATUS.connect('file-loaded', self.file_loaded)
-        STATUS.connect('homed', self.homed)
-        STATUS.connect('all-homed', self.all_homed)
-        STATUS.connect('not-all-homed', self.not_all_homed)
-        STATUS.connect('periodic', lambda w: self.update_runtimer())
-        STATUS.connect('command-stopped', lambda w: self.stop_timer())
+        self.connect_status('general', self.dialog_return)
+        self.connect_status('state-on', lambda w: self.enable_onoff(True))
+        self.connect_status('state-off', lambda w: self.enable_onoff(False))
+        self.connect_status('mode-manual', lambda w: self.enable_auto(False))
+        self.connect_status('mode-mdi', lambda w: self.enable_auto(False))
+        self.connect_status('mode-auto', lambda w: self.enable_auto(True))
+        self.connect_status('gcode-line-selected', lambda w, line: self.set_start_line(line))
+        self.connect_status('hard-limits-tripped', self.hard_limit_tripped)
+        self.connect_status('program-pause-changed', lambda w, state: self.w.btn_spindle_pause.setEnabled(state))
+        self.connect_status('actual-spindle-speed-changed', lambda w, speed: self.update_rpm(speed))
+        self.connect_status('user-system-changed', lambda w, data: self.user_system_changed(data))
+        self.connect_status('metric-mode-changed', lambda w, mode: self.metric_mode_changed(mode))
+        self.connect_status('file-loaded', self.file_loaded)
+        self.connect_status('homed', self.homed)
+        self.connect_status('all-homed', self.all_homed)
+        self.connect_status('not-all-homed', self.not_all_homed)
+        SCHEDULER.register('runtimer', lambda stat: self.update_runtimer(), PRIORITY_HIGH)
+        SCHEDULER.register('perf counters', lambda stat: self.sample_periodic(), PRIORITY_HIGH)
+        self.connect_status('command-stopped', lambda w: self.stop_timer())
 
     def class_patch__(self):
         self.old_fman = FM.load
@@ -99,6 +126,8 @@ class HandlerClass:
         self.init_preferences()
         self.init_widgets()
         self.init_vtk()
+        self.init_perf_counters()
+        self.init_thumbnails()
         self.init_probe()
         self.init_utils()
         self.w.stackedWidget_log.setCurrentIndex(0)
@@ -144,26 +173,41 @@ class HandlerClass:
         self.w.btn_program_bounds.clicked.connect(self.showProgramBounds)
         self.w.btn_machine_labels.clicked.connect(self.showMachineLabels)
         self.w.btn_program_labels.clicked.connect(self.showProgramLabels)
+        self.w.chk_alpha_mode.stateChanged.connect(self.chk_alpha_mode_changed)
+        self.vtkbackplot.alphaBlend(self.w.chk_alpha_mode.isChecked())
 
     #############################
     # SPECIAL FUNCTIONS SECTION #
     #############################
     def init_pins(self):
-        # spindle control pins
-        pin = self.h.newpin("spindle_amps", hal.HAL_FLOAT, hal.HAL_IN)
-        hal_glib.GPin(pin).connect("value_changed", self.spindle_pwr_changed)
-        pin = self.h.newpin("spindle_volts", hal.HAL_FLOAT, hal.HAL_IN)
-        hal_glib.GPin(pin).connect("value_changed", self.spindle_pwr_changed)
-        pin = self.h.newpin("spindle_fault", hal.HAL_U32, hal.HAL_IN)
-        hal_glib.GPin(pin).connect("value_changed", self.spindle_fault_changed)
-        pin = self.h.newpin("modbus-errors", hal.HAL_U32, hal.HAL_IN)
-        hal_glib.GPin(pin).connect("value_changed", self.mb_errors_changed)
+        # spindle control pins, the labels follow them once per tick, the
+        # alarms are not skipped when a tick runs late
+        self.pin_watch = PinWatch(self.h)
+        self.alarm_watch = PinWatch(self.h, 'alarm pin watch', PRIORITY_NORMAL)
+        self.h.newpin("spindle_amps", hal.HAL_FLOAT, hal.HAL_IN)
+        self.h.newpin("spindle_volts", hal.HAL_FLOAT, hal.HAL_IN)
+        self.pin_watch.watch(("spindle_amps", "spindle_volts"), self.spindle_pwr_changed,
+                             self.spindle_pwr_texts, 0.05)
+        self.h.newpin("spindle_fault", hal.HAL_U32, hal.HAL_IN)
+        self.alarm_watch.watch(("spindle_fault",), self.spindle_fault_changed)
+        self.h.newpin("modbus-errors", hal.HAL_U32, hal.HAL_IN)
+        self.alarm_watch.watch(("modbus-errors",), self.mb_errors_changed)
         self.h.newpin("spindle_pause", hal.HAL_BIT, hal.HAL_OUT)
         # external offset control pins
         self.h.newpin("eoffset_enable", hal.HAL_BIT, hal.HAL_OUT)
         self.h.newpin("eoffset_clear", hal.HAL_BIT, hal.HAL_OUT)
         self.h.newpin("eoffset_count", hal.HAL_S32, hal.HAL_OUT)
         pin = self.h.newpin("eoffset_value", hal.HAL_FLOAT, hal.HAL_IN)
+        # gui performance counters, times in ms
+        self.h.newpin("perf_periodic_ms", hal.HAL_FLOAT, hal.HAL_OUT)
+        self.h.newpin("perf_periodic_max_ms", hal.HAL_FLOAT, hal.HAL_OUT)
+        self.h.newpin("perf_periodic_avg_ms", hal.HAL_FLOAT, hal.HAL_OUT)
+        self.h.newpin("perf_periodic_interval_ms", hal.HAL_FLOAT, hal.HAL_OUT)
+        self.h.newpin("perf_render_ms", hal.HAL_FLOAT, hal.HAL_OUT)
+        self.h.newpin("perf_preview_segments", hal.HAL_S32, hal.HAL_OUT)
+        self.h.newpin("perf_load_ms", hal.HAL_FLOAT, hal.HAL_OUT)
+        self.h.newpin("perf_live_plot_points", hal.HAL_S32, hal.HAL_OUT)
+        self.h.newpin("perf_rss_mb", hal.HAL_FLOAT, hal.HAL_OUT)
 
     def init_preferences(self):
         if not self.w.PREFS_:
@@ -225,6 +269,8 @@ class HandlerClass:
         self.w.PREFS_.putpref('Use alpha display mode', self.w.chk_alpha_mode.isChecked(), bool, 'CUSTOM_FORM_ENTRIES')
         if self.probe:
             self.probe.closing_cleanup__()
+        self.thumbnailer.close()
+        self.vtkbackplot.closeStockPool()
 
     def init_widgets(self):
         self.w.main_tab_widget.setCurrentIndex(TAB_MAIN)
@@ -285,7 +331,62 @@ class HandlerClass:
     def init_vtk(self):
         self.vtkbackplot = VTKBackPlot()
         self.vtkbackplot.setObjectName("vtkbackplot")
+        self.vtkbackplot.statusMessage.connect(self.add_status)
         self.w.layout_vtk.addWidget(self.vtkbackplot)
+        # Z slab sliders in 0.1% of the program height and a section plane
+        # through the current view
+        self.slider_zmin = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self.slider_zmax = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        for slider, value in ((self.slider_zmin, 0), (self.slider_zmax, 1000)):
+            slider.setRange(0, 1000)
+            slider.setValue(value)
+            slider.valueChanged.connect(self.z_slab_changed)
+        self.btn_section = QtWidgets.QPushButton("SECTION")
+        self.btn_section.setCheckable(True)
+        self.btn_section.clicked.connect(self.btn_section_clicked)
+        # the program drawn again at the other work offsets
+        self.btn_fixtures = QtWidgets.QPushButton("FIXTURES")
+        self.btn_fixtures.setCheckable(True)
+        self.btn_fixtures.clicked.connect(self.btn_fixtures_clicked)
+        # the differences to the program selected in the file manager
+        self.btn_compare = QtWidgets.QPushButton("COMPARE")
+        self.btn_compare.setCheckable(True)
+        self.btn_compare.clicked.connect(self.btn_compare_clicked)
+        layout = QtWidgets.QHBoxLayout()
+        layout.addWidget(QtWidgets.QLabel("Z MIN"))
+        layout.addWidget(self.slider_zmin)
+        layout.addWidget(QtWidgets.QLabel("Z MAX"))
+        layout.addWidget(self.slider_zmax)
+        layout.addWidget(self.btn_section)
+        layout.addWidget(self.btn_fixtures)
+        layout.addWidget(self.btn_compare)
+        self.w.layout_vtk.addLayout(layout)
+
+    def init_perf_counters(self):
+        # the periodic times are published every tick, the rest once a second
+        self.lbl_perf = QtWidgets.QLabel()
+        self.lbl_perf.setObjectName("lbl_perf")
+        self.w.widget_status_log.layout().addWidget(self.lbl_perf)
+        self.perf_timer = QtCore.QTimer()
+        self.perf_timer.setInterval(1000)
+        self.perf_timer.timeout.connect(self.update_perf_counters)
+        self.perf_timer.start()
+
+    def connect_status(self, signal, callback):
+        # the callbacks are traced spans while tracing is on
+        STATUS.connect(signal, TRACER.wrap(callback, signal, 'status'))
+
+    def init_thumbnails(self):
+        self.thumbnailer = Thumbnailer()
+        self.thumbnailer.thumbnailReady.connect(self.thumbnail_ready)
+        self.preview_file = None
+        self.lbl_file_preview = QtWidgets.QLabel()
+        self.lbl_file_preview.setFixedSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        self.lbl_file_preview.setAlignment(QtCore.Qt.AlignCenter)
+        self.w.widget_file_copy.layout().addWidget(self.lbl_file_preview)
+        for manager in (self.w.filemanager, self.w.filemanager_usb):
+            manager.list.clicked.connect(lambda index, manager=manager: self.file_selected(manager))
+            manager.model.directoryLoaded.connect(self.thumbnailer.request_directory)
 
     def init_utils(self):
         from facing import Facing
@@ -377,25 +478,23 @@ class HandlerClass:
     # CALLBACKS FROM STATUS #
     #########################
 
-    def spindle_pwr_changed(self, data):
+    def spindle_pwr_texts(self, amps, volts):
         # this calculation assumes the voltage is line to neutral
         # that the current reported by the VFD is total current for all 3 phases
         # and that the synchronous motor spindle has a power factor of 0.9
-        power = self.h['spindle_volts'] * self.h['spindle_amps'] * 0.9 # V x I x PF
-        amps = "{:1.1f}".format(self.h['spindle_amps'])
-        volts = "{:1.1f}".format(self.h['spindle_volts'])
-        pwr = "{:1.1f}".format(power)
-        self.w.lbl_spindle_amps.setText(amps)
-        self.w.lbl_spindle_volts.setText(volts)
-        self.w.lbl_spindle_power.setText(pwr)
-
-    def spindle_fault_changed(self, data):
-        fault = hex(self.h['spindle_fault'])
-        self.w.lbl_spindle_fault.setText(fault)
-
-    def mb_errors_changed(self, data):
-        errors = self.h['modbus-errors']
-        self.w.lbl_mb_errors.setText(str(errors))
+        power = volts * amps * 0.9 # V x I x PF
+        return "{:1.1f}".format(amps), "{:1.1f}".format(volts), "{:1.1f}".format(power)
+
+    def spindle_pwr_changed(self, amps, volts, power):
+        self.pin_watch.set_text(self.w.lbl_spindle_amps, amps)
+        self.pin_watch.set_text(self.w.lbl_spindle_volts, volts)
+        self.pin_watch.set_text(self.w.lbl_spindle_power, power)
+
+    def spindle_fault_changed(self, fault):
+        self.alarm_watch.set_text(self.w.lbl_spindle_fault, hex(fault))
+
+    def mb_errors_changed(self, errors):
+        self.alarm_watch.set_text(self.w.lbl_mb_errors, str(errors))
 
     def dialog_return(self, w, message):
         rtn = message.get('RETURN')
@@ -428,6 +527,12 @@ class HandlerClass:
         self.w.lbl_max_rapid.setText("{:4.0f}".format(maxvel))
 
     def file_loaded(self, obj, filename):
+        # the slab belongs to the old program, runs before the backplot loads
+        self.slider_zmin.setValue(0)
+        self.slider_zmax.setValue(1000)
+        if self.btn_section.isChecked():
+            self.btn_section.setChecked(False)
+            self.vtkbackplot.clearSectionPlanes()
         if filename is not None:
             self.add_status("Loaded file {}".format(filename))
             self.w.progressBar.setValue(0)
@@ -456,10 +561,7 @@ class HandlerClass:
         i = int(joint)
         axis = INFO.GET_NAME_FROM_JOINT.get(i).lower()
         try:
-            widget = self.w["dro_axis_{}".format(axis)]
-            widget.setProperty('homed', True)
-            widget.style().unpolish(widget)
-            widget.style().polish(widget)
+            self.style_state.set(self.w["dro_axis_{}".format(axis)], 'homed', True)
         except:
             pass
 
@@ -486,10 +588,7 @@ class HandlerClass:
             if str(i) in list:
                 axis = INFO.GET_NAME_FROM_JOINT.get(i).lower()
                 try:
-                    widget = self.w["dro_axis_{}".format(axis)]
-                    widget.setProperty('homed', False)
-                    widget.style().unpolish(widget)
-                    widget.style().polish(widget)
+                    self.style_state.set(self.w["dro_axis_{}".format(axis)], 'homed', False)
                 except:
                     pass
 
@@ -694,6 +793,19 @@ class HandlerClass:
         except Exception as e:
             self.add_status("Unable to copy file. %s" %e)
 
+    def file_selected(self, manager):
+        fname = manager.getCurrentSelected()
+        self.lbl_file_preview.clear()
+        if fname[1] is True:
+            self.preview_file = fname[0]
+            self.thumbnailer.request(fname[0])
+        else:
+            self.preview_file = None
+
+    def thumbnail_ready(self, fname, png):
+        if fname == self.preview_file:
+            self.lbl_file_preview.setPixmap(QtGui.QPixmap(png))
+
     # offsets tab
     def btn_goto_sensor_clicked(self):
         x = float(self.w.lineEdit_sensor_x.text())
@@ -784,7 +896,41 @@ class HandlerClass:
         self.w.btn_start.setText("START\n1") if state else self.w.btn_start.setText("START")
 
     def chk_alpha_mode_changed(self, state):
-        self.vtkbackplot.alphaBlend(state)
+        self.vtkbackplot.alphaBlend(bool(state))
+
+    def z_slab_changed(self, value):
+        lower = self.slider_zmin.value()
+        upper = self.slider_zmax.value()
+        if lower == 0 and upper == 1000:
+            self.vtkbackplot.clearZSlab()
+        else:
+            self.vtkbackplot.setZSlabFraction(lower / 1000.0, upper / 1000.0)
+
+    def btn_section_clicked(self, state):
+        if not state:
+            self.vtkbackplot.clearSectionPlanes()
+        elif not self.vtkbackplot.addViewSectionPlane():
+            self.btn_section.setChecked(False)
+
+    def btn_fixtures_clicked(self, state):
+        # every work system with an offset, unused ones are all zero
+        if not state:
+            self.vtkbackplot.clearFixtures()
+            return
+        offsets = self.vtkbackplot.read_g5x_offsets()
+        self.vtkbackplot.setFixtures([index for index, offset in offsets.items() if any(offset)])
+
+    def btn_compare_clicked(self, state):
+        # the loaded program stays compared with the reference until cleared
+        if not state:
+            self.vtkbackplot.clearReference()
+        elif self.preview_file is None:
+            self.add_status("Select a reference program in the file manager first")
+            self.btn_compare.setChecked(False)
+        elif self.vtkbackplot.loadReference(self.preview_file):
+            self.add_status("Comparing with {}".format(self.preview_file))
+        else:
+            self.btn_compare.setChecked(False)
 
     def chk_use_camera_changed(self, state):
         self.w.btn_ref_camera.setEnabled(state)
@@ -925,14 +1071,8 @@ class HandlerClass:
         else:
             in_range = (self.min_spindle_rpm <= int(speed) <= self.max_spindle_rpm)
             at_speed = self.h['led_atspeed']
-        widget = self.w.lbl_spindle_set
-        widget.setProperty('in_range', in_range)
-        widget.style().unpolish(widget)
-        widget.style().polish(widget)
-        widget = self.w.status_rpm
-        widget.setProperty('at_speed', at_speed)
-        widget.style().unpolish(widget)
-        widget.style().polish(widget)
+        self.style_state.set(self.w.lbl_spindle_set, 'in_range', in_range)
+        self.style_state.set(self.w.status_rpm, 'at_speed', at_speed)
 
     def update_runtimer(self):
         if self.timer_on is False or STATUS.is_auto_paused(): return
@@ -944,6 +1084,32 @@ class HandlerClass:
             minutes, seconds = divmod(remainder, 60)
             self.w.lbl_runtime.setText("{:02d}:{:02d}:{:02d}".format(hours, minutes, seconds))
 
+    def sample_periodic(self):
+        # runs inside a tick, so these are of the tick before
+        self.h['perf_periodic_ms'] = SCHEDULER.tick_time * 1000
+        self.h['perf_periodic_interval_ms'] = SCHEDULER.tick_interval * 1000
+
+    def update_perf_counters(self):
+        counters = self.vtkbackplot.get_perf_counters()
+        average, maximum = SCHEDULER.take_window()
+        average *= 1000
+        maximum *= 1000
+        rss = get_rss_mb()
+        self.h['perf_periodic_max_ms'] = maximum
+        self.h['perf_periodic_avg_ms'] = average
+        self.h['perf_render_ms'] = counters['frame_time'] * 1000
+        self.h['perf_preview_segments'] = counters['preview_segments']
+        self.h['perf_load_ms'] = counters['load_time'] * 1000
+        self.h['perf_live_plot_points'] = counters['live_plot_points']
+        self.h['perf_rss_mb'] = rss
+        if self.w.main_tab_widget.currentIndex() == TAB_STATUS:
+            self.lbl_perf.setText("PERIODIC\n{:.1f} ms\nAVG {:.1f}\nMAX {:.1f}\n"
+                                  "RENDER\n{:.1f} ms\nLOAD\n{:.2f} s\nPREVIEW\n{}\n"
+                                  "LIVE PLOT\n{}\nRSS\n{:.0f} MB".format(
+                                  self.h['perf_periodic_ms'], average, maximum,
+                                  counters['frame_time'] * 1000, counters['load_time'],
+                                  counters['preview_segments'], counters['live_plot_points'], rss))
+
     def stop_timer(self):
         self.timer_on = False
         if STATUS.is_auto_mode():
@@ -1005,6 +1171,22 @@ class HandlerClass:
         if self.use_keyboard():
             self.kb_jog(state, 3, -1, shift, False)
 
+    def on_keycall_F11(self,event,state,shift,cntrl):
+        # starts tracing, the next press writes the trace to the config dir
+        if not state: return
+        if not TRACER.enabled:
+            TRACER.start()
+            self.add_status("Tracing started, press F11 again to save the trace")
+            return
+        TRACER.stop()
+        fname = os.path.join(PATH.CONFIGPATH, time.strftime("trace-%Y%m%d-%H%M%S.json"))
+        try:
+            count = TRACER.export(fname)
+            self.add_status("Saved {} trace events to {}".format(count, fname))
+        except (IOError, OSError) as e:
+            self.add_status("Unable to save trace. {}".format(e))
+        TRACER.clear()
+
     def on_keycall_F12(self,event,state,shift,cntrl):
         if state:
             self.styleeditor.load_dialog()
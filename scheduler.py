@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# One 'periodic' status callback for all the periodic work of the screen. Tasks
+# register with a priority and a rate, every tick, every nth tick or only while
+# a widget is visible, and are called with the stat of the tick, which qtvcp
+# has already polled.
+#
+#   SCHEDULER.register('runtimer', self.update_runtimer, PRIORITY_HIGH)
+#   SCHEDULER.register('offsets', self.check_offsets, every=10, widget=self)
+#
+# When a tick runs longer than its budget, the cycle time by default, the low
+# priority tasks that are left wait for the next tick, but never more than
+# MAX_SKIPS ticks in a row. Tasks slower than the slow limit are logged, and a
+# task that raises is logged without stopping the tasks after it.
+import time
+import traceback
+
+from qtvcp.core import Info, Status
+from qtvcp import logger
+from tracing import TRACER
+
+LOG = logger.getLogger(__name__)
+INFO = Info()
+STATUS = Status()
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# seconds a task may take before it is logged, and between two logs of a task
+SLOW_LIMIT = 0.05
+SLOW_LOG_INTERVAL = 10.0
+# ticks in a row a low priority task may be skipped before it runs anyway
+MAX_SKIPS = 10
+
+
+def get_cycle_time():
+    # qtvcp takes the [DISPLAY] CYCLE_TIME in ms, or in seconds when below 1
+    try:
+        cycle_time = float(INFO.get_error_safe_setting('DISPLAY', 'CYCLE_TIME', '100'))
+    except ValueError:
+        cycle_time = 100.0
+    return cycle_time if cycle_time < 1 else cycle_time / 1000.0
+
+
+class Task(object):
+    def __init__(self, name, callback, priority, every, widget):
+        self.name = name
+        self.callback = callback
+        self.priority = priority
+        self.every = max(1, int(every))
+        self.widget = widget
+        self.next_tick = 0
+        self.calls = 0
+        self.skipped = 0
+        self.waiting = 0
+        self.errors = 0
+        self.last_error = 0.0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.slow_calls = 0
+        self.last_warning = 0.0
+
+    def is_due(self, tick):
+        if tick < self.next_tick:
+            return False
+        return self.widget is None or self.widget.isVisible()
+
+
+class Scheduler(object):
+    def __init__(self):
+        self.tasks = list()
+        self.connected = False
+        self.budget = None
+        self.slow_limit = SLOW_LIMIT
+        self.ticks = 0
+        self.overruns = 0
+        self.last_tick = None
+        # of the last tick, and collected until take_window()
+        self.tick_time = 0.0
+        self.tick_interval = 0.0
+        self.window_ticks = 0
+        self.window_total = 0.0
+        self.window_max = 0.0
+
+    def start(self, budget=None, slow_limit=None):
+        if budget is not None:
+            self.budget = budget
+        elif self.budget is None:
+            self.budget = get_cycle_time()
+        if slow_limit is not None:
+            self.slow_limit = slow_limit
+        if not self.connected:
+            STATUS.connect('periodic', lambda w: self.tick())
+            self.connected = True
+
+    def register(self, name, callback, priority=PRIORITY_NORMAL, every=1, widget=None):
+        # callback(stat), tasks of the same priority run in the order registered
+        self.start()
+        task = Task(name, callback, priority, every, widget)
+        index = len(self.tasks)
+        while index > 0 and self.tasks[index - 1].priority > priority:
+            index -= 1
+        self.tasks.insert(index, task)
+        return task
+
+    def unregister(self, name):
+        self.tasks = [task for task in self.tasks if task.name != name]
+
+    def tick(self):
+        start = time.time()
+        if self.last_tick is not None:
+            self.tick_interval = start - self.last_tick
+        self.last_tick = start
+        self.ticks += 1
+        stat = STATUS.stat
+        deadline = start + self.budget
+        overrun = False
+        for task in self.tasks:
+            if not task.is_due(self.ticks):
+                continue
+            task_start = time.time()
+            if task.priority >= PRIORITY_LOW and task_start > deadline and task.waiting < MAX_SKIPS:
+                # stays due, runs in the next tick with time left
+                task.skipped += 1
+                task.waiting += 1
+                overrun = True
+                continue
+            task.waiting = 0
+            try:
+                with TRACER.span(task.name, 'periodic'):
+                    task.callback(stat)
+            except Exception:
+                self.failed_task(task)
+            task.next_tick = self.ticks + task.every
+            duration = time.time() - task_start
+            task.calls += 1
+            task.total_time += duration
+            task.max_time = max(task.max_time, duration)
+            if duration > self.slow_limit:
+                self.slow_task(task, duration)
+        if overrun:
+            self.overruns += 1
+        self.tick_time = time.time() - start
+        self.window_ticks += 1
+        self.window_total += self.tick_time
+        self.window_max = max(self.window_max, self.tick_time)
+
+    def slow_task(self, task, duration):
+        task.slow_calls += 1
+        now = time.time()
+        if now - task.last_warning < SLOW_LOG_INTERVAL:
+            return
+        LOG.warning("Periodic task {} took {:.1f} ms, {} slow calls of {}, max {:.1f} ms".format(
+            task.name, duration * 1000, task.slow_calls, task.calls, task.max_time * 1000))
+        task.last_warning = now
+
+    def failed_task(self, task):
+        task.errors += 1
+        now = time.time()
+        if now - task.last_error < SLOW_LOG_INTERVAL:
+            return
+        LOG.error("Periodic task {} failed, {} errors of {} calls:\n{}".format(
+            task.name, task.errors, task.calls + 1, traceback.format_exc()))
+        task.last_error = now
+
+    def take_window(self):
+        # average and max tick time since the last call, in seconds
+        average = self.window_total / self.window_ticks if self.window_ticks else 0.0
+        window_max = self.window_max
+        self.window_ticks = 0
+        self.window_total = 0.0
+        self.window_max = 0.0
+        return average, window_max
+
+    def get_stats(self):
+        # name, priority, calls, skipped, average and max time in ms per task
+        return [(task.name, task.priority, task.calls, task.skipped,
+                 task.total_time / task.calls * 1000 if task.calls else 0.0,
+                 task.max_time * 1000) for task in self.tasks]
+
+
+SCHEDULER = Scheduler()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# Material removal on a 2.5D heightfield. The tool path is sampled into the
+# lowest tool tip height per grid cell, then every cell takes the lowest
+# point of the cutter placed on any tip around it, a min-plus erosion with
+# the cutter profile. The grid is split into tiles that can be eroded in a
+# pool of worker processes, the pool is passed in so it can be reused.
+import math
+import numpy as np
+
+TILE_SIZE = 128
+
+
+def cutter_profile(radius, shape, cell_size):
+    # cell offsets covered by the cutter and the height of its bottom there
+    reach = int(math.ceil(radius / cell_size))
+    dy, dx = np.mgrid[-reach:reach + 1, -reach:reach + 1]
+    distance = np.hypot(dx, dy) * cell_size
+    inside = distance <= radius + cell_size * 0.5
+    distance = np.minimum(distance[inside], radius)
+    if shape == 'ball':
+        heights = radius - np.sqrt(radius * radius - distance * distance)
+    else:
+        heights = np.zeros(len(distance))
+    return dx[inside], dy[inside], heights.astype(np.float32), reach
+
+
+def sample_segments(segments, spacing):
+    # points along all segments, no further apart than spacing
+    starts, ends = segments[:, 0:3], segments[:, 3:6]
+    lengths = np.linalg.norm(ends - starts, axis=1)
+    steps = np.maximum(1, np.ceil(lengths / spacing)).astype(int)
+    sizes = steps + 1
+    first = np.cumsum(sizes) - sizes
+    segment = np.repeat(np.arange(len(segments)), sizes)
+    fraction = (np.arange(int(sizes.sum())) - first[segment]) / steps[segment].astype(float)
+    return starts[segment] + fraction[:, None] * (ends - starts)[segment]
+
+
+def erode(tip, dx, dy, heights, reach):
+    # min-plus erosion of a tip window that has reach cells margin
+    rows = tip.shape[0] - 2 * reach
+    columns = tip.shape[1] - 2 * reach
+    surface = np.full((rows, columns), np.inf, dtype=np.float32)
+    for x, y, height in zip(dx, dy, heights):
+        window = tip[reach + y:reach + y + rows, reach + x:reach + x + columns]
+        np.minimum(surface, window + height, out=surface)
+    return surface
+
+
+def erode_job(job):
+    tile, tip, dx, dy, heights, reach = job
+    return tile, erode(tip, dx, dy, heights, reach)
+
+
+class Heightfield:
+    def __init__(self, bounds, cell_size, top, bottom):
+        # bounds are xmin, xmax, ymin, ymax of the stock
+        self.cell_size = float(cell_size)
+        self.origin = (bounds[0], bounds[2])
+        self.top = top
+        self.bottom = bottom
+        self.columns = int(math.ceil((bounds[1] - bounds[0]) / self.cell_size)) + 1
+        self.rows = int(math.ceil((bounds[3] - bounds[2]) / self.cell_size)) + 1
+        self.heights = np.full((self.rows, self.columns), top, dtype=np.float32)
+        self.footprints = dict()
+
+    def get_tiles(self):
+        # (row, column) of every tile
+        return [(row, column)
+                for row in range(0, self.rows, TILE_SIZE)
+                for column in range(0, self.columns, TILE_SIZE)]
+
+    def get_tile_slice(self, tile):
+        row, column = tile
+        return (slice(row, min(row + TILE_SIZE, self.rows)),
+                slice(column, min(column + TILE_SIZE, self.columns)))
+
+    def get_footprint(self, radius, shape):
+        # the cutter profile as a square array, inf outside of the cutter
+        key = (radius, shape)
+        if key not in self.footprints:
+            dx, dy, heights, reach = cutter_profile(radius, shape, self.cell_size)
+            footprint = np.full((2 * reach + 1, 2 * reach + 1), np.inf, dtype=np.float32)
+            footprint[dy + reach, dx + reach] = heights
+            self.footprints[key] = (footprint, reach)
+        return self.footprints[key]
+
+    def raster(self, points, reach):
+        # lowest tip per cell, with reach cells of margin on every side
+        tip = np.full((self.rows + 2 * reach, self.columns + 2 * reach), np.inf, dtype=np.float32)
+        columns = np.round((points[:, 0] - self.origin[0]) / self.cell_size).astype(int) + reach
+        rows = np.round((points[:, 1] - self.origin[1]) / self.cell_size).astype(int) + reach
+        keep = ((points[:, 2] < self.top) & (rows >= 0) & (rows < tip.shape[0])
+                & (columns >= 0) & (columns < tip.shape[1]))
+        np.minimum.at(tip, (rows[keep], columns[keep]), points[keep, 2].astype(np.float32))
+        return tip
+
+    def cut_jobs(self, segments, radius, shape='flat'):
+        # the erode_job arguments of every tile the segments reach
+        dx, dy, heights, reach = cutter_profile(radius, shape, self.cell_size)
+        points = sample_segments(segments, self.cell_size * 0.5)
+        tip = self.raster(points, reach)
+        jobs = list()
+        for tile in self.get_tiles():
+            rows, columns = self.get_tile_slice(tile)
+            window = tip[rows.start:rows.stop + 2 * reach, columns.start:columns.stop + 2 * reach]
+            if np.isfinite(window).any():
+                jobs.append((tile, window, dx, dy, heights, reach))
+        return jobs
+
+    def cut_paths(self, segments, radius, shape='flat', pool=None):
+        # removes the material of all segments, returns the changed tiles
+        jobs = self.cut_jobs(segments, radius, shape)
+        if pool is not None and len(jobs) > 1:
+            results = pool.map(erode_job, jobs)
+        else:
+            results = [erode_job(job) for job in jobs]
+        return self.apply_results(results)
+
+    def apply_results(self, results):
+        # the eroded tiles of erode_job, returns the changed tiles
+        for tile, surface in results:
+            region = self.get_tile_slice(tile)
+            np.minimum(self.heights[region], np.maximum(surface, self.bottom), out=self.heights[region])
+        return [tile for tile, surface in results]
+
+    def cut_move(self, start, end, radius, shape='flat'):
+        # removes the material of one move, the cost follows its length and
+        # not the size of the stock, returns the changed tiles
+        footprint, reach = self.get_footprint(radius, shape)
+        points = sample_segments(np.array([tuple(start[:3]) + tuple(end[:3])], dtype=float),
+                                 self.cell_size * 0.5)
+        points = points[points[:, 2] < self.top]
+        columns = np.round((points[:, 0] - self.origin[0]) / self.cell_size).astype(int)
+        rows = np.round((points[:, 1] - self.origin[1]) / self.cell_size).astype(int)
+        tiles = set()
+        for row, column, z in zip(rows, columns, points[:, 2]):
+            row0, row1 = max(row - reach, 0), min(row + reach + 1, self.rows)
+            column0, column1 = max(column - reach, 0), min(column + reach + 1, self.columns)
+            if row0 >= row1 or column0 >= column1:
+                continue
+            region = self.heights[row0:row1, column0:column1]
+            cutter = footprint[row0 - row + reach:row1 - row + reach,
+                               column0 - column + reach:column1 - column + reach]
+            np.minimum(region, np.maximum(cutter + z, self.bottom), out=region)
+            for tile_row in range(row0 // TILE_SIZE, (row1 - 1) // TILE_SIZE + 1):
+                for tile_column in range(column0 // TILE_SIZE, (column1 - 1) // TILE_SIZE + 1):
+                    tiles.add((tile_row * TILE_SIZE, tile_column * TILE_SIZE))
+        return tiles
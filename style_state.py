@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# Dynamic properties that the stylesheet selects on, like [homed=true]. A
+# property is only set when its value changes, and the widgets that changed
+# are repolished together once the event loop runs again, so several changes
+# in one status update cost one restyle per widget.
+#
+#   self.style_state.set(self.w.status_rpm, 'at_speed', at_speed)
+from PyQt5.QtCore import QTimer
+
+
+class StyleState(object):
+    def __init__(self):
+        # widget -> {property: value}
+        self.properties = dict()
+        self.pending = list()
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.flush)
+
+    def set(self, widget, name, value):
+        state = self.properties.get(widget)
+        if state is None:
+            state = self.properties[widget] = dict()
+        if name not in state:
+            state[name] = widget.property(name)
+        if state[name] == value:
+            return
+        state[name] = value
+        widget.setProperty(name, value)
+        if widget not in self.pending:
+            self.pending.append(widget)
+            self.timer.start()
+
+    def flush(self):
+        pending = self.pending
+        self.pending = list()
+        for widget in pending:
+            style = widget.style()
+            style.unpolish(widget)
+            style.polish(widget)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# PNG previews of programs for the file managers. The programs are parsed with
+# BaseBackPlot and drawn with an offscreen VTK render window in a pool of
+# worker processes, VTK needs no display when it is built with OSMesa or EGL.
+# The images are cached by the hash of the file content, so a file is only
+# rendered once, wherever it is and whatever its name.
+import os
+import stat
+import hashlib
+import multiprocessing
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from base_canon import BaseCanon
+
+THUMBNAIL_SIZE = 200
+THUMBNAIL_VERSION = 1
+# moves shorter than this are merged, in program units (inch)
+THUMBNAIL_TOLERANCE = 0.005
+THUMBNAIL_MAX_POINTS = 200000
+THUMBNAIL_EXTENSIONS = ('.ngc', '.nc', '.tap', '.gcode')
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'qtdragon', 'thumbnails')
+
+FEED_COLOR = (1.0, 1.0, 1.0)
+TRAVERSE_COLOR = (0.3, 0.5, 0.3)
+BACKGROUND_COLOR = (0.1, 0.1, 0.15)
+
+
+class ThumbnailCanon(BaseCanon):
+    # keeps polylines of the path only, short moves are merged
+    def __init__(self, tolerance=THUMBNAIL_TOLERANCE):
+        super(ThumbnailCanon, self).__init__()
+        self.arcdivision = 16
+        self.tolerance = tolerance
+        self.points = list()
+        self.lines = list()
+        self.kinds = list()
+        self.last_kind = None
+        self.last_point = None
+
+    def add_path_point(self, line_type, start_point, end_point):
+        kind = 'traverse' if line_type == 'traverse' else 'feed'
+        end = tuple(end_point[:3])
+        if kind != self.last_kind or self.last_point != tuple(start_point[:3]):
+            self.lines.append([len(self.points)])
+            self.kinds.append(kind)
+            self.points.append(tuple(start_point[:3]))
+        elif max(abs(e - p) for e, p in zip(end, self.points[-1])) < self.tolerance:
+            self.last_point = end
+            return
+        self.lines[-1].append(len(self.points))
+        self.points.append(end)
+        self.last_kind = kind
+        self.last_point = end
+
+
+def file_hash(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_name(digest, size):
+    return os.path.join(CACHE_DIR, '{}_{}_{}.png'.format(digest, size, THUMBNAIL_VERSION))
+
+
+def scan_directory(path):
+    # runs in a worker process, the programs of a directory with their
+    # mtime and size, a slow share never holds up the screen
+    programs = list()
+    try:
+        names = sorted(os.listdir(path))
+    except OSError:
+        return programs
+    for name in names:
+        if not name.lower().endswith(THUMBNAIL_EXTENSIONS):
+            continue
+        filename = os.path.join(path, name)
+        try:
+            status = os.stat(filename)
+        except OSError:
+            continue
+        if stat.S_ISREG(status.st_mode):
+            programs.append((filename, status.st_mtime, status.st_size))
+    return programs
+
+
+def render_thumbnail(job):
+    # runs in a worker process, returns the file name and its png
+    inifile, filename, size = job
+    png = cache_name(file_hash(filename), size)
+    if os.path.isfile(png):
+        return filename, png
+
+    import vtk
+    from base_backplot import BaseBackPlot
+
+    backplot = BaseBackPlot(inifile, canon=ThumbnailCanon)
+    backplot.load(filename)
+    canon = backplot.canon
+    # too many points still, every nth point of a polyline is enough
+    stride = len(canon.points) // THUMBNAIL_MAX_POINTS + 1
+
+    points = vtk.vtkPoints()
+    for point in canon.points:
+        points.InsertNextPoint(point)
+    lines = vtk.vtkCellArray()
+    colors = vtk.vtkUnsignedCharArray()
+    colors.SetNumberOfComponents(3)
+    for line, kind in zip(canon.lines, canon.kinds):
+        ids = line[::stride]
+        if ids[-1] != line[-1]:
+            ids.append(line[-1])
+        lines.InsertNextCell(len(ids))
+        for point_id in ids:
+            lines.InsertCellPoint(point_id)
+        color = FEED_COLOR if kind == 'feed' else TRAVERSE_COLOR
+        colors.InsertNextTuple3(*[c * 255 for c in color])
+    poly_data = vtk.vtkPolyData()
+    poly_data.SetPoints(points)
+    poly_data.SetLines(lines)
+    poly_data.GetCellData().SetScalars(colors)
+
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputData(poly_data)
+    actor = vtk.vtkActor()
+    actor.SetMapper(mapper)
+    renderer = vtk.vtkRenderer()
+    renderer.SetBackground(*BACKGROUND_COLOR)
+    renderer.AddActor(actor)
+    camera = renderer.GetActiveCamera()
+    camera.SetPosition(1, -1, 1)
+    camera.SetViewUp(0, 0, 1)
+    renderer.ResetCamera()
+    window = vtk.vtkRenderWindow()
+    window.SetOffScreenRendering(1)
+    window.SetSize(size, size)
+    window.AddRenderer(renderer)
+    window.Render()
+
+    image = vtk.vtkWindowToImageFilter()
+    image.SetInput(window)
+    image.Update()
+    if not os.path.isdir(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+    # written under a temporary name, a reader never sees half a file
+    temp = png + '.{}.tmp'.format(os.getpid())
+    writer = vtk.vtkPNGWriter()
+    writer.SetFileName(temp)
+    writer.SetInputConnection(image.GetOutputPort())
+    writer.Write()
+    window.Finalize()
+    os.rename(temp, png)
+    return filename, png
+
+
+class Thumbnailer(QObject):
+    thumbnailReady = pyqtSignal(str, str)
+
+    def __init__(self, inifile=None, size=THUMBNAIL_SIZE, processes=None):
+        super(Thumbnailer, self).__init__()
+        self.inifile = inifile or os.getenv("INI_FILE_NAME")
+        self.size = size
+        self.processes = processes or max(1, multiprocessing.cpu_count() - 1)
+        self.pool = None
+        # filename: (mtime, size, png) of the rendered files
+        self.thumbnails = dict()
+        # filename: (mtime, size, async result) of the files in the pool
+        self.pending = dict()
+        # path: async result of the directories scanned in the pool
+        self.scans = dict()
+        self.timer = QTimer()
+        self.timer.setInterval(200)
+        self.timer.timeout.connect(self.collect)
+
+    def get_pool(self):
+        # spawned, a forked worker would inherit the Qt and GL state
+        if self.pool is None:
+            context = multiprocessing.get_context('spawn')
+            self.pool = context.Pool(self.processes, maxtasksperchild=50)
+        return self.pool
+
+    def get_thumbnail(self, filename):
+        # the png of an unchanged file, or None
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        entry = self.thumbnails.get(filename)
+        if entry and entry[:2] == (stat.st_mtime, stat.st_size) and os.path.isfile(entry[2]):
+            return entry[2]
+        return None
+
+    def request(self, filename):
+        # thumbnailReady is emitted when the png is there, maybe right away
+        if not filename.lower().endswith(THUMBNAIL_EXTENSIONS) or not os.path.isfile(filename):
+            return
+        png = self.get_thumbnail(filename)
+        if png is not None:
+            self.thumbnailReady.emit(filename, png)
+            return
+        status = os.stat(filename)
+        self.submit(filename, status.st_mtime, status.st_size)
+
+    def submit(self, filename, mtime, size):
+        # a render job, unless the file is rendered or in the pool already
+        entry = self.thumbnails.get(filename)
+        if entry and entry[:2] == (mtime, size) and os.path.isfile(entry[2]):
+            return
+        entry = self.pending.get(filename)
+        if entry and entry[:2] == (mtime, size):
+            return
+        job = (self.inifile, filename, self.size)
+        result = self.get_pool().apply_async(render_thumbnail, (job,))
+        self.pending[filename] = (mtime, size, result)
+        self.timer.start()
+
+    def request_directory(self, path):
+        # renders every program of a directory ahead of the user, the
+        # directory is read in the pool as well
+        if path in self.scans:
+            return
+        self.scans[path] = self.get_pool().apply_async(scan_directory, (path,))
+        self.timer.start()
+
+    def collect(self):
+        for path, result in list(self.scans.items()):
+            if not result.ready():
+                continue
+            del self.scans[path]
+            try:
+                programs = result.get()
+            except Exception as e:
+                print("Can't scan {} for thumbnails: {}".format(path, e))
+                continue
+            for filename, mtime, size in programs:
+                self.submit(filename, mtime, size)
+        for filename, (mtime, size, result) in list(self.pending.items()):
+            if not result.ready():
+                continue
+            del self.pending[filename]
+            try:
+                filename, png = result.get()
+            except Exception as e:
+                print("No thumbnail for {}: {}".format(filename, e))
+                continue
+            self.thumbnails[filename] = (mtime, size, png)
+            self.thumbnailReady.emit(filename, png)
+        if not self.pending and not self.scans:
+            self.timer.stop()
+
+    def close(self):
+        self.timer.stop()
+        self.pending.clear()
+        self.scans.clear()
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# Opt-in timing spans for the load and periodic pipelines. Spans go into a ring
+# buffer, so a long running GUI keeps only the latest ones, and are written in
+# the Chrome trace event format, to be opened in chrome://tracing or Perfetto.
+#
+#   with TRACER.span('gcode.parse', 'load'):
+#       ...
+#
+# While tracing is off a span is a shared object that does nothing.
+import os
+import json
+import time
+import threading
+from collections import deque
+
+TRACE_BUFFER = 200000
+
+
+class NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span(object):
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        end = time.time()
+        self.tracer.events.append((self.name, self.category, self.start, end - self.start,
+                                   threading.current_thread().ident, self.args))
+        return False
+
+
+class Tracer(object):
+    def __init__(self, size=TRACE_BUFFER):
+        self.enabled = False
+        # name, category, start, duration, thread, args
+        self.events = deque(maxlen=size)
+
+    def start(self, size=None):
+        if size is not None and size != self.events.maxlen:
+            self.events = deque(maxlen=size)
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def clear(self):
+        self.events.clear()
+
+    def add(self, name, category, start, duration, args=None):
+        # a span that was timed elsewhere, like by vtk observers
+        if self.enabled:
+            self.events.append((name, category, start, duration,
+                                threading.current_thread().ident, args))
+
+    def span(self, name, category='gui', args=None):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, args)
+
+    def wrap(self, callback, name, category='gui'):
+        # a callback that runs in a span when tracing is on
+        def traced(*args, **kwargs):
+            if not self.enabled:
+                return callback(*args, **kwargs)
+            with Span(self, name, category, None):
+                return callback(*args, **kwargs)
+        return traced
+
+    def get_trace(self):
+        # complete events, timestamps and durations in microseconds
+        pid = os.getpid()
+        trace = list()
+        for name, category, start, duration, thread, args in list(self.events):
+            event = dict(name=name, cat=category, ph='X', pid=pid, tid=thread,
+                         ts=int(start * 1e6), dur=int(duration * 1e6))
+            if args:
+                event['args'] = args
+            trace.append(event)
+        return dict(traceEvents=trace, displayTimeUnit='ms')
+
+    def export(self, filename):
+        # returns the number of events written
+        trace = self.get_trace()
+        with open(filename, 'w') as f:
+            json.dump(trace, f)
+        return len(trace['traceEvents'])
+
+
+TRACER = Tracer()
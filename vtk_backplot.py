@@ -1,12 +1,17 @@
 #!/usr/bin/env python
 import os
-from math import cos, sin, radians
+import time
+import multiprocessing
+import hashlib
+from math import atan2, cos, sin, radians, tan, pi, log, floor
 from operator import add
 from collections import OrderedDict
 import linuxcnc
-from PyQt5.QtGui import QColor
-from PyQt5.QtCore import pyqtProperty
+import numpy as np
+from PyQt5.QtGui import QColor, QMouseEvent
+from PyQt5.QtCore import pyqtProperty, pyqtSignal, QTimer
 import vtk
+from vtk.util import numpy_support
 
 # Fix polygons not drawing correctly on some GPU
 # https://stackoverflow.com/questions/51357630/vtk-rendering-not-working-as-expected-inside-pyqt?rq=1
@@ -20,6 +25,10 @@ from qtvcp.core import Info, Status, Tool
 from qtvcp.widgets.tool_offsetview import ToolOffsetView as TOOL_TABLE
 from base_canon import StatCanon
 from base_backplot import BaseBackPlot
+import program_diff
+from stock_sim import Heightfield, TILE_SIZE, erode_job
+from tracing import TRACER
+from scheduler import SCHEDULER, PRIORITY_HIGH, PRIORITY_NORMAL
 
 INFO = Info()
 STATUS = Status()
@@ -28,12 +37,57 @@ INIFILE = INFO.INIPATH
 BASE = BaseBackPlot(INIFILE)
 MACHINE_UNITS = INFO.get_error_safe_setting("TRAJ", "LINEAR_UNITS", "metric")
 LATHE = INFO.get_error_safe_setting("DISPLAY", "LATHE", False)
+# the A axis turns around X, a '-A' in the display geometry flips it like in axis
+ROTARY = 'A' in INFO.get_error_safe_setting("TRAJ", "COORDINATES", "XYZ").upper()
+ROTARY_SIGN = -1.0 if '-A' in INFO.get_error_safe_setting("DISPLAY", "GEOMETRY", "XYZ").upper() else 1.0
+# largest A change in degrees drawn as one straight piece in the wrapped view
+ROTARY_STEP = 2.0
+# metric conversion of the 9 axis positions, angles are left alone
+METRIC_SCALE = (25.4, 25.4, 25.4, 1.0, 1.0, 1.0, 25.4, 25.4, 25.4)
+PREVIEW_MEMORY_MB = INFO.get_error_safe_setting("DISPLAY", "PREVIEW_MEMORY_MB", "256")
+# rough cost of one stored segment, the python tuples in path_points plus
+# the vtk points, cells and colors built from them
+SEGMENT_BYTES = 1024
+MARKER_BYTES = 256
+# an arc record and its tessellated points and cell
+ARC_BYTES = 2048
+# preview simplifications, in the order they are switched on
+PREVIEW_LEVELS = ('full', 'coarse arcs', 'no traverses', 'overview')
 COLOR_MAP = {
     'traverse': (188, 252, 201, 75),
     'arcfeed': (255, 255, 255, 128),
-    'feed': (255, 255, 255, 84),
+    'feed': (255, 255, 255, 84)}
+# cell scalars of the path data are indexes into this tuple
+LINE_TYPES = ('traverse', 'arcfeed', 'feed')
+MARKER_MAP = {
     'dwell': (100, 100, 100, 255),
-    'user': (100, 100, 100, 255)}
+    'user': (100, 100, 100, 255),
+    'toolchange': (255, 160, 0, 255),
+    'hole': (0, 200, 255, 255),
+    'arrow': (255, 255, 255, 128)}
+# clipping planes a mapper takes, two of them are kept for the Z slab
+MAX_CLIPPING_PLANES = 6
+MAX_SECTION_PLANES = MAX_CLIPPING_PLANES - 2
+STOCK_COLOR = (150, 170, 190)
+# cells along the longest side of the simulated stock
+STOCK_RESOLUTION = 1000
+DIFF_COLORS = (
+    (0, 220, 0, 255),      # added
+    (230, 40, 40, 255),    # removed
+    (255, 180, 0, 255))    # changed
+# first, second and axial coordinate of the arc planes, as used by
+# gcode.arc_to_segments (1 = G17, 2 = G19, 3 = G18)
+ARC_PLANE_AXES = {1: (0, 1, 2), 2: (1, 2, 0), 3: (2, 0, 1)}
+CIRCLE_FUZZ = 1e-6
+# camera position and view up of the standard views, looking at the origin,
+# and the zoom after the camera reset (FIXME the zooms are a hack)
+VIEW_PRESETS = OrderedDict([
+    ('P', ((1, -1, 1), (0, 0, 1), 1.1)),
+    ('X', ((1, 0, 0), (0, 0, 1), 1.5)),
+    ('XZ', ((0, -1, 0), (-1, 0, 0), 1.5)),
+    ('Y', ((0, -1, 0), (0, 0, 1), 1.5)),
+    ('Z', ((0, 0, 1), (0, 1, 0), 2.0)),
+    ('Z2', ((0, 0, 1), (1, 0, 0), 1.0))])
 
 
 class PathActor(vtk.vtkActor):
@@ -45,23 +99,29 @@ class PathActor(vtk.vtkActor):
         self.lathe = LATHE
 
         if self.units in ("mm", "metric"):
-            self.length = 25.0
+            self.axes_length = 25.0
         else:
-            self.length = 1.0
+            self.axes_length = 1.0
         self.axes = Axes()
         self.axes_actor = self.axes.get_actor()
         if self.lathe is True:
-            self.axes_actor.SetTotalLength(self.length, 0, self.length)
+            self.axes_actor.SetTotalLength(self.axes_length, 0, self.axes_length)
         else:
-            self.axes_actor.SetTotalLength(self.length, self.length, self.length)
+            self.axes_actor.SetTotalLength(self.axes_length, self.axes_length, self.axes_length)
 
-        # Create a vtkUnsignedCharArray container and store the colors in it
+        # Create a vtkUnsignedCharArray container and store the line types in it,
+        # they are mapped to colors by the lookup table of the mapper
         self.colors = vtk.vtkUnsignedCharArray()
-        self.colors.SetNumberOfComponents(4)
+        self.colors.SetNumberOfComponents(1)
         self.points = vtk.vtkPoints()
         self.lines = vtk.vtkCellArray()
         self.poly_data = vtk.vtkPolyData()
         self.data_mapper = vtk.vtkPolyDataMapper()
+        self.markers = OrderedDict()
+        self.blocks = list()
+        self.arcs = None
+        self.rotary = None
+        self.wrapped = False
 
     def set_origin_index(self, index):
         self.origin_index = index
@@ -78,9 +138,183 @@ class PathActor(vtk.vtkActor):
     def get_axes(self):
         return self.axes_actor
 
+    def add_markers(self, kind, points, color):
+        self.markers[kind] = Markers(kind, points, color)
+
+    def get_marker_actors(self):
+        return [markers.get_actor() for markers in self.markers.values()]
+
+    def add_block(self, block):
+        block.set_path_transform(self.GetUserTransform())
+        self.blocks.append(block)
+
+    def get_block_actors(self):
+        actors = list()
+        for block in self.blocks:
+            actors.extend(block.get_actors())
+        return actors
+
+    def set_arcs(self, arcs):
+        arcs.get_actor().SetUserTransform(self.GetUserTransform())
+        self.arcs = arcs
+
+    def get_arc_actors(self):
+        if self.arcs is None:
+            return []
+        return [self.arcs.get_actor()]
+
+    def get_child_actors(self):
+        return self.get_marker_actors() + self.get_block_actors() + self.get_arc_actors()
+
+    def get_segments(self, chord_error=None):
+        # all segments in program coordinates as rows of x1 y1 z1 x2 y2 z2,
+        # repeated blocks at each of their places, arcs as two chords or
+        # tessellated to the chord error
+        parts = [poly_data_segments(self.poly_data)]
+        for block in self.blocks:
+            segments = poly_data_segments(block.poly_data)
+            for translation in block.translations:
+                parts.append(segments + np.tile(translation[:3], 2))
+        if self.arcs is not None:
+            if chord_error is None:
+                parts.append(self.arcs.get_chords())
+            else:
+                parts.append(self.arcs.get_segments(chord_error))
+        return np.concatenate(parts)
+
+    def set_rotary(self, rotary):
+        self.rotary = rotary
+
+    def set_wrapped(self, wrapped):
+        # the wrapped data holds the blocks as well, markers have no angle
+        if self.rotary is None:
+            return
+        self.wrapped = wrapped
+        if wrapped:
+            self.data_mapper.SetInputData(self.rotary.poly_data)
+        else:
+            self.data_mapper.SetInputData(self.poly_data)
+        for actor in self.get_block_actors() + self.get_marker_actors():
+            actor.SetVisibility(not wrapped)
+        if not wrapped and 'arrow' in self.markers:
+            self.markers['arrow'].get_actor().SetVisibility(Markers.show_arrows)
+        if self.arcs is not None:
+            self.arcs.set_wrapped(wrapped)
+
+    def get_bounds(self):
+        # world bounds of the path including all block instances
+        bounds = list(self.GetBounds())
+        actors = self.get_arc_actors()
+        if not self.wrapped:
+            actors = self.get_block_actors() + actors
+        for actor in actors:
+            actor_bounds = actor.GetBounds()
+            if bounds[0] > bounds[1]:
+                # this actor has no lines, only arcs or blocks
+                bounds = list(actor_bounds)
+                continue
+            bounds[0::2] = map(min, bounds[0::2], actor_bounds[0::2])
+            bounds[1::2] = map(max, bounds[1::2], actor_bounds[1::2])
+        return bounds
+
+    def get_data_bounds(self):
+        # bounds in program coordinates, None if there is nothing to show
+        bounds = None
+        poly_data = self.rotary.poly_data if self.wrapped else self.poly_data
+        if poly_data.GetNumberOfPoints():
+            bounds = list(poly_data.GetBounds())
+        if self.arcs is not None:
+            arc_bounds = self.arcs.poly_data.GetBounds()
+            if bounds is None:
+                bounds = list(arc_bounds)
+            else:
+                bounds[0::2] = map(min, bounds[0::2], arc_bounds[0::2])
+                bounds[1::2] = map(max, bounds[1::2], arc_bounds[1::2])
+        if self.wrapped:
+            return bounds
+        for block in self.blocks:
+            block_bounds = block.poly_data.GetBounds()
+            for translation in block.translations:
+                lower = [b + t for b, t in zip(block_bounds[0::2], translation)]
+                upper = [b + t for b, t in zip(block_bounds[1::2], translation)]
+                if bounds is None:
+                    bounds = [lower[0], upper[0], lower[1], upper[1], lower[2], upper[2]]
+                else:
+                    bounds[0::2] = map(min, bounds[0::2], lower)
+                    bounds[1::2] = map(max, bounds[1::2], upper)
+        return bounds
+
+    def get_instance_sources(self):
+        # the actors an instance of this path has to mirror, with the
+        # translation they have relative to the path
+        sources = [(self, None)]
+        sources.extend((actor, None) for actor in self.get_marker_actors())
+        sources.extend((actor, None) for actor in self.get_arc_actors())
+        for block in self.blocks:
+            sources.extend(block.get_instances())
+        return sources
+
+    def get_path_mappers(self):
+        # the mappers that color by line type
+        mappers = [self.data_mapper] + [block.data_mapper for block in self.blocks]
+        if self.arcs is not None:
+            mappers.append(self.arcs.data_mapper)
+        return mappers
+
+    def get_mappers(self):
+        mappers = [self.data_mapper]
+        for markers in self.markers.values():
+            mappers.append(markers.get_mapper())
+        for block in self.blocks:
+            mappers.append(block.data_mapper)
+        if self.arcs is not None:
+            mappers.append(self.arcs.data_mapper)
+        return mappers
+
+    def get_stats(self):
+        # segments, points and cells as drawn, memory of the geometry in bytes
+        poly_datas = [self.poly_data]
+        segments = self.poly_data.GetNumberOfCells()
+        cells = segments
+        points = self.poly_data.GetNumberOfPoints()
+        gpu_memory = estimate_gpu_memory(self.poly_data)
+        for block in self.blocks:
+            count = len(block.translations)
+            poly_datas.append(block.poly_data)
+            segments += block.poly_data.GetNumberOfCells() * count
+            cells += block.poly_data.GetNumberOfCells()
+            points += block.poly_data.GetNumberOfPoints()
+            gpu_memory += estimate_gpu_memory(block.poly_data)
+        for markers in self.markers.values():
+            poly_datas.append(markers.poly_data)
+            cells += markers.poly_data.GetNumberOfPoints()
+            points += markers.poly_data.GetNumberOfPoints()
+            # one transform matrix and color per glyph
+            gpu_memory += markers.poly_data.GetNumberOfPoints() * 68
+        if self.arcs is not None:
+            arc_data = self.arcs.poly_data
+            poly_datas.append(arc_data)
+            segments += arc_data.GetNumberOfPoints() - arc_data.GetNumberOfCells()
+            cells += arc_data.GetNumberOfCells()
+            points += arc_data.GetNumberOfPoints()
+            gpu_memory += estimate_gpu_memory(arc_data)
+        cpu_memory = sum(poly_data.GetActualMemorySize() for poly_data in poly_datas) * 1024
+        return dict(segments=segments, points=points, cells=cells,
+                    cpu_memory=cpu_memory, gpu_memory=gpu_memory)
+
+    def set_path_transform(self, transform):
+        self.SetUserTransform(transform)
+        self.axes_actor.SetUserTransform(transform)
+        for actor in self.get_marker_actors():
+            actor.SetUserTransform(transform)
+        for block in self.blocks:
+            block.set_path_transform(transform)
+        for actor in self.get_arc_actors():
+            actor.SetUserTransform(transform)
+
 
 class VTKCanon(StatCanon):
-    def __init__(self, colors=COLOR_MAP, *args, **kwargs):
+    def __init__(self, marker_colors=MARKER_MAP, *args, **kwargs):
         super(VTKCanon, self).__init__(*args, **kwargs)
         self.units = MACHINE_UNITS
         self.index_map = dict()
@@ -93,12 +327,43 @@ class VTKCanon(StatCanon):
         self.index_map[7] = 591
         self.index_map[8] = 592
         self.index_map[9] = 593
-        self.path_colors = colors
+        self.line_types = dict((line_type, index) for index, line_type in enumerate(LINE_TYPES))
+        self.marker_colors = marker_colors
         self.path_actors = OrderedDict()
         self.path_points = OrderedDict()
+        self.path_markers = OrderedDict()
+        # arcs are kept as records and tessellated for the current view
+        self.path_arcs = OrderedDict()
+        # every nth feed move gets a direction arrow
+        self.arrow_stride = 25
+        self.feed_count = 0
+        # repeated runs of segments, keyed by a hash of their translation
+        # normalized coordinates
+        self.blocks = dict()
+        self.run_start = dict()
+        self.arc_start = dict()
+        self.min_block_size = 16
+        self.max_block_size = 20000
+        self.block_quantum = 1e-4
+        # the preview is simplified step by step when it grows too big
+        try:
+            self.memory_budget = int(float(PREVIEW_MEMORY_MB) * 1048576)
+        except ValueError:
+            self.memory_budget = 256 * 1048576
+        self.memory_used = 0
+        self.preview_level = 0
+        # moves left out when even the overview is full
+        self.dropped = 0
+        self.decimate_stride = 1
+        self.decimate_count = 0
+        self.protected = dict()
+        self.next_threshold = self.memory_budget // 2
+        self.collinear_tolerance = 1e-6
         origin = 540
         self.path_actors[origin] = PathActor()
         self.path_points[origin] = list()
+        self.path_markers[origin] = OrderedDict()
+        self.path_arcs[origin] = list()
         self.origin = origin
         self.previous_origin = origin
         self.ignore_next = False  # hacky way to ignore the second point next to a offset change
@@ -112,69 +377,351 @@ class VTKCanon(StatCanon):
         if origin not in self.path_actors.keys():
             self.path_actors[origin] = PathActor()
             self.path_points[origin] = list()
+            self.path_markers[origin] = OrderedDict()
+            self.path_arcs[origin] = list()
             self.previous_origin = self.origin
             self.origin = origin
 
-    def add_path_point(self, line_type, start_point, end_point):
+    def skip_move(self):
         if self.ignore_next is True:
             self.ignore_next = False
-            return
+            return True
 
         if self.previous_origin != self.origin:
             self.previous_origin = self.origin
             self.ignore_next = True
+            return True
+        return False
+
+    def add_path_point(self, line_type, start_point, end_point):
+        if self.skip_move():
             return
         path_points = self.path_points.get(self.origin)
 
+        if self.memory_used >= self.next_threshold:
+            self.degrade()
+
+        if line_type == 'feed' and self.preview_level < 3:
+            self.feed_count += 1
+            if self.feed_count % self.arrow_stride == 0:
+                direction = [e - s for s, e in zip(start_point[:3], end_point[:3])]
+                if any(direction):
+                    middle = [(s + e) / 2.0 for s, e in zip(start_point[:3], end_point[:3])]
+                    self.add_marker('arrow', middle, direction)
+
         if self.units in ("mm", "metric"):
-            start_point_list = list()
-            for point in end_point:
-                point *= 25.4
-                start_point_list.append(point)
+            start_point = tuple(p * s for p, s in zip(start_point, METRIC_SCALE))
+            end_point = tuple(p * s for p, s in zip(end_point, METRIC_SCALE))
+        else:
+            start_point = tuple(start_point)
+            end_point = tuple(end_point)
+
+        # traverses split the path into runs that are checked for repeats
+        if line_type == 'traverse':
+            self.close_run(self.origin)
+            if self.preview_level < 2:
+                path_points.append((line_type, (start_point, end_point)))
+                self.memory_used += SEGMENT_BYTES
+            self.run_start[self.origin] = len(path_points)
+            self.arc_start[self.origin] = len(self.path_arcs[self.origin])
+        elif not self.merge_segment(path_points, line_type, start_point, end_point):
+            if not self.make_room():
+                return
+            path_points.append((line_type, (start_point, end_point)))
+            self.memory_used += SEGMENT_BYTES
+
+    def arc_feed(self, end_x, end_y, center_x, center_y, rot, end_z, a, b, c, u, v, w):
+        # same geometry as gcode.arc_to_segments, but stored as one record
+        if self.suppress > 0:
+            return
 
-            end_point_list = list()
-            for point in end_point:
-                point *= 25.4
-                end_point_list.append(point)
+        self.first_move = False
+        start = self.last_pos
+        first, second, axial = ARC_PLANE_AXES.get(self.plane, ARC_PLANE_AXES[1])
+        end = [0.0] * 9
+        end[first] = end_x
+        end[second] = end_y
+        end[axial] = end_z
+        end[3:] = [a, b, c, u, v, w]
+        self.last_pos = tuple(end)
+        if self.skip_move():
+            return
+        if self.memory_used >= self.next_threshold:
+            self.degrade()
+        if not self.make_room():
+            return
 
-            line = list()
-            line.append(start_point_list)
-            line.append(end_point_list)
-            path_points.append((line_type, line))
+        theta1 = atan2(start[second] - center_y, start[first] - center_x)
+        theta2 = atan2(end_y - center_y, end_x - center_x)
+        if rot < 0:
+            while theta2 - theta1 > -CIRCLE_FUZZ:
+                theta2 -= 2 * pi
+        else:
+            while theta2 - theta1 < CIRCLE_FUZZ:
+                theta2 += 2 * pi
+        # multi turn arcs
+        if rot < -1:
+            theta2 += 2 * pi * (rot + 1)
+        if rot > 1:
+            theta2 += 2 * pi * (rot - 1)
+        radius1 = ((start[first] - center_x) ** 2 + (start[second] - center_y) ** 2) ** 0.5
+        radius2 = ((end_x - center_x) ** 2 + (end_y - center_y) ** 2) ** 0.5
+        scale = 25.4 if self.units in ("mm", "metric") else 1.0
+        self.path_arcs[self.origin].append(
+            (self.plane if self.plane in ARC_PLANE_AXES else 1,
+             center_x * scale, center_y * scale, radius1 * scale, radius2 * scale,
+             theta1, theta2 - theta1)
+            + tuple(value * scale for value in start[:3])
+            + tuple(value * scale for value in end[:3])
+            + (start[3], end[3]))
+        self.memory_used += ARC_BYTES
+
+    def degrade(self):
+        # switch on the next simplification, in overview mode every step
+        # also halves what is already stored to make room for the rest
+        if self.preview_level < len(PREVIEW_LEVELS) - 1:
+            self.preview_level += 1
+            if self.preview_level == 1:
+                self.arcdivision = 16
+        if self.preview_level == 3:
+            if self.decimate_stride < 1024:
+                self.decimate_stride *= 2
+            for origin in self.path_points.keys():
+                self.compact(origin)
+        step = max((self.memory_budget - self.memory_used) // 2, self.memory_budget // 16)
+        self.next_threshold = self.memory_used + step
+
+    def make_room(self):
+        # keep simplifying while that can still free memory, a move that
+        # does not fit after all is counted and left out
+        while self.memory_used >= self.memory_budget and (
+                self.preview_level < len(PREVIEW_LEVELS) - 1 or self.decimate_stride < 1024):
+            self.degrade()
+        if self.memory_used >= self.memory_budget:
+            self.dropped += 1
+            return False
+        return True
 
+    def compact(self, origin):
+        # merge pairs of connected segments, the sources of blocks are kept,
+        # runs that did not repeat so far are given up as block candidates
+        path_points = self.path_points[origin]
+        protected = 0
+        for key, block in list(self.blocks.items()):
+            if block['origin'] != origin:
+                continue
+            if block['instances']:
+                protected = max(protected, block['start'] + block['length'])
+            else:
+                del self.blocks[key]
+        compacted = list()
+        merged = True
+        for line_type, (start_point, end_point) in path_points[protected:]:
+            if not merged:
+                last_type, (last_start, last_end) = compacted[-1]
+                if last_type == line_type and last_end[:3] == start_point[:3]:
+                    compacted[-1] = (line_type, (last_start, end_point))
+                    merged = True
+                    continue
+            compacted.append((line_type, (start_point, end_point)))
+            merged = False
+        self.memory_used -= (len(path_points) - protected - len(compacted)) * SEGMENT_BYTES
+        path_points[protected:] = compacted
+        self.protected[origin] = protected
+        self.run_start[origin] = len(path_points)
+        self.arc_start[origin] = len(self.path_arcs[origin])
+
+    def merge_segment(self, path_points, line_type, start_point, end_point):
+        # extend the last segment instead of adding one, collinear segments
+        # from the first level on, every segment but the stride'th in overview
+        if self.preview_level == 0:
+            return False
+        # the last segment may belong to a run that is a block source
+        if self.preview_level == 3:
+            limit = self.protected.get(self.origin, 0)
+        else:
+            limit = self.run_start.get(self.origin, 0)
+        if len(path_points) <= limit:
+            return False
+        last_type, (last_start, last_end) = path_points[-1]
+        if last_type != line_type or last_end[:3] != start_point[:3]:
+            return False
+        if self.preview_level == 3:
+            self.decimate_count += 1
+            merge = self.decimate_count % self.decimate_stride != 0
         else:
-            line = list()
-            line.append(start_point)
-            line.append(end_point)
-            path_points.append((line_type, line))
+            merge = False
+        if not merge:
+            first = [e - s for s, e in zip(last_start[:3], last_end[:3])]
+            second = [e - s for s, e in zip(start_point[:3], end_point[:3])]
+            cross = (first[1] * second[2] - first[2] * second[1],
+                     first[2] * second[0] - first[0] * second[2],
+                     first[0] * second[1] - first[1] * second[0])
+            dot = sum(f * s for f, s in zip(first, second))
+            merge = dot > 0 and sum(c * c for c in cross) <= self.collinear_tolerance * dot * dot
+        if merge:
+            path_points[-1] = (line_type, (last_start, end_point))
+        return merge
+
+    def get_simplification(self):
+        # a description of what was left out, None for a full preview
+        if self.preview_level == 0 and not self.dropped:
+            return None
+        levels = list(PREVIEW_LEVELS[1:self.preview_level + 1])
+        if self.decimate_stride > 1:
+            levels[-1] = '{} 1:{}'.format(levels[-1], self.decimate_stride)
+        if self.dropped:
+            levels.append('{} moves left out'.format(self.dropped))
+        return ', '.join(levels)
+
+    def close_run(self, origin):
+        # A run that already occurred somewhere else, only translated, is
+        # replaced by an instance of the first occurrence. Runs are always
+        # at the end of path_points, so deleting one never moves a block.
+        path_points = self.path_points[origin]
+        path_arcs = self.path_arcs[origin]
+        start = self.run_start.get(origin, 0)
+        arc_start = self.arc_start.get(origin, 0)
+        self.run_start[origin] = len(path_points)
+        self.arc_start[origin] = len(path_arcs)
+        length = len(path_points) - start
+        arc_length = len(path_arcs) - arc_start
+        if self.preview_level == 3:
+            # the overview is merged across runs, repeats are not looked for
+            return
+        if not self.min_block_size <= length + arc_length <= self.max_block_size:
+            return
+        key, base = self.block_key(path_points[start:], path_arcs[arc_start:])
+        block = self.blocks.get(key)
+        if block is None:
+            self.blocks[key] = dict(origin=origin, start=start, length=length,
+                                    arc_start=arc_start, arc_length=arc_length,
+                                    base=base, instances=list())
+        else:
+            block['instances'].append((origin, base))
+            self.memory_used -= length * SEGMENT_BYTES + arc_length * ARC_BYTES
+            del path_points[start:]
+            del path_arcs[arc_start:]
+            self.run_start[origin] = start
+            self.arc_start[origin] = arc_start
+
+    def block_key(self, run, arcs=()):
+        if run:
+            base = run[0][1][0][:3]
+        else:
+            base = arcs[0][7:10]
+        quantum = self.block_quantum
+        values = list()
+        for line_type, line in run:
+            values.append(line_type)
+            for point in line:
+                values.extend(int(round((p - b) / quantum)) for p, b in zip(point[:3], base))
+                values.append(int(round(point[3] / quantum)))
+        for arc in arcs:
+            first, second = ARC_PLANE_AXES[arc[0]][:2]
+            values.append(arc[0])
+            values.extend((int(round((arc[1] - base[first]) / quantum)),
+                           int(round((arc[2] - base[second]) / quantum))))
+            values.extend(int(round(value / quantum)) for value in arc[3:7])
+            values.extend(int(round((p - b) / quantum)) for p, b in zip(arc[7:10], base))
+            values.extend(int(round((p - b) / quantum)) for p, b in zip(arc[10:13], base))
+            values.extend(int(round(value / quantum)) for value in arc[13:15])
+        return hashlib.sha1(repr(values).encode('utf-8')).digest(), base
+
+    def move_arc(self, arc, translation):
+        # an arc record moved by a translation
+        first, second = ARC_PLANE_AXES[arc[0]][:2]
+        return ((arc[0], arc[1] + translation[first], arc[2] + translation[second])
+                + tuple(arc[3:7])
+                + tuple(p + t for p, t in zip(arc[7:10], translation))
+                + tuple(p + t for p, t in zip(arc[10:13], translation))
+                + tuple(arc[13:15]))
+
+    def add_marker(self, kind, point, direction=None):
+        if self.memory_used >= self.memory_budget:
+            return
+        point = list(point[:3])
+        if self.units in ("mm", "metric"):
+            point = [value * 25.4 for value in point]
+        markers = self.path_markers.get(self.origin)
+        markers.setdefault(kind, list()).append((point, direction))
+        self.memory_used += MARKER_BYTES
+
+    def build_lines(self, data, points, lines, colors, base=(0.0, 0.0, 0.0)):
+        # consecutive segments share their points, a new point is only
+        # started where the path is not continuous
+        index = -1
+        last_point = None
+        for line_type, (start_point, end_point) in data:
+            start_point = tuple(p - b for p, b in zip(start_point[:3], base))
+            end_point = tuple(p - b for p, b in zip(end_point[:3], base))
+            if start_point != last_point:
+                points.InsertNextPoint(start_point)
+                index += 1
+            points.InsertNextPoint(end_point)
+            index += 1
+            lines.InsertNextCell(2)
+            lines.InsertCellPoint(index - 1)
+            lines.InsertCellPoint(index)
+            colors.InsertNextValue(self.line_types[line_type])
+            last_point = end_point
+
+    def rotary_segments(self, data, translation=(0.0, 0.0, 0.0)):
+        # x, y, z, a of start and end of every segment and the line types
+        segments = np.array([start_point[:4] + end_point[:4] for line_type, (start_point, end_point) in data],
+                            dtype=float).reshape(-1, 8)
+        segments[:, 0:3] += translation
+        segments[:, 4:7] += translation
+        types = np.array([self.line_types[line_type] for line_type, line in data], dtype=np.uint8)
+        return segments, types
 
     def draw_lines(self):
+        for origin in self.path_points.keys():
+            self.close_run(origin)
+
+        # the wrapped view is built from all segments, including the repeats
+        rotary = OrderedDict()
+        if ROTARY:
+            for origin, data in self.path_points.items():
+                rotary[origin] = [self.rotary_segments(data)]
+
+        for key, block in self.blocks.items():
+            if not block['instances']: continue
+            # the arcs of the repeats are tessellated with all the other arcs
+            source_arcs = self.path_arcs[block['origin']]
+            arcs = source_arcs[block['arc_start']:block['arc_start'] + block['arc_length']]
+            for origin, translation in block['instances']:
+                delta = [t - b for t, b in zip(translation, block['base'])]
+                self.path_arcs[origin].extend(self.move_arc(arc, delta) for arc in arcs)
+            if not block['length']: continue
+            source = self.path_points[block['origin']]
+            data = source[block['start']:block['start'] + block['length']]
+            translations = OrderedDict()
+            for origin, translation in block['instances']:
+                translations.setdefault(origin, list()).append(translation)
+            for origin, origin_translations in translations.items():
+                path_block = PathBlock(origin_translations)
+                self.build_lines(data, path_block.points, path_block.lines,
+                                 path_block.colors, block['base'])
+                path_block.update()
+                self.path_actors.get(origin).add_block(path_block)
+                if ROTARY:
+                    rotary[origin].extend(
+                        self.rotary_segments(data, [t - b for t, b in zip(translation, block['base'])])
+                        for translation in origin_translations)
+        self.blocks = dict()
+
+        for origin, parts in rotary.items():
+            segments = np.concatenate([part[0] for part in parts])
+            if np.any(segments[:, [3, 7]]):
+                types = np.concatenate([part[1] for part in parts])
+                self.path_actors.get(origin).set_rotary(RotaryPath(segments, types))
+
         for origin, data in self.path_points.items():
             path_actor = self.path_actors.get(origin)
-            index = 0
-            end_point = None
-            last_line_type = None
-            for line_type, line_data in data:
-                start_point = line_data[0]
-                end_point = line_data[1]
-                last_line_type = line_type
-                path_actor.points.InsertNextPoint(start_point[:3])
-                path_actor.colors.InsertNextTypedTuple(self.path_colors[line_type])
-                line = vtk.vtkLine()
-                line.GetPointIds().SetId(0, index)
-                line.GetPointIds().SetId(1, index + 1)
-                path_actor.lines.InsertNextCell(line)
-                index += 1
-
-            if end_point:
-                path_actor.points.InsertNextPoint(end_point[:3])
-                path_actor.colors.InsertNextTypedTuple(self.path_colors[last_line_type])
-                line = vtk.vtkLine()
-                line.GetPointIds().SetId(0, index - 1)
-                line.GetPointIds().SetId(1, index)
-                path_actor.lines.InsertNextCell(line)
+            self.build_lines(data, path_actor.points, path_actor.lines, path_actor.colors)
             # free up memory, lots of it for big files
-            self.path_points[self.origin] = list()
+            self.path_points[origin] = list()
             path_actor.poly_data.SetPoints(path_actor.points)
             path_actor.poly_data.SetLines(path_actor.lines)
             path_actor.poly_data.GetCellData().SetScalars(path_actor.colors)
@@ -182,12 +729,26 @@ class VTKCanon(StatCanon):
             path_actor.data_mapper.Update()
             path_actor.SetMapper(path_actor.data_mapper)
 
+        for origin, markers in self.path_markers.items():
+            path_actor = self.path_actors.get(origin)
+            for kind, points in markers.items():
+                path_actor.add_markers(kind, points, self.marker_colors[kind])
+            self.path_markers[origin] = OrderedDict()
+
+        for origin, arcs in self.path_arcs.items():
+            if arcs:
+                self.path_actors.get(origin).set_arcs(ArcPaths(arcs, self.arcdivision))
+            self.path_arcs[origin] = list()
+
     def get_path_actors(self):
         return self.path_actors
 
 
 #class VTKBackPlot(QVTKRenderWindowInteractor, VCPWidget, BaseBackPlot):
 class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
+    # emitted with a message for the status bar
+    statusMessage = pyqtSignal(str)
+
     def __init__(self, parent=None):
         super(VTKBackPlot, self).__init__(parent)
 
@@ -248,11 +809,47 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
         self.camera.SetClippingRange(self.clipping_range_near, self.clipping_range_far)
         self.renderer = vtk.vtkRenderer()
         self.renderer.SetActiveCamera(self.camera)
+        # the tool and the live plot are drawn in a second layer on top of a
+        # cached image of the static scene
+        self.overlay_renderer = vtk.vtkRenderer()
+        self.overlay_renderer.SetActiveCamera(self.camera)
+        self.overlay_renderer.SetLayer(1)
+        self.overlay_renderer.InteractiveOff()
         self.renderer_window = self.GetRenderWindow()
+        self.renderer_window.SetNumberOfLayers(2)
         self.renderer_window.AddRenderer(self.renderer)
+        self.renderer_window.AddRenderer(self.overlay_renderer)
+        self.static_cache = StaticSceneCache(self.renderer_window, self.renderer,
+                                             self.overlay_renderer, self.camera)
+        # while the mouse moves the camera, big paths are drawn decimated and
+        # without multisampling, one full quality frame follows when idle
+        self.interacting = False
+        self.interactive_lod = InteractiveLOD(self.renderer)
+        self.target_frame_time = 0.05
+        self.still_multisamples = self.renderer_window.GetMultiSamples()
+        self.idle_timer = QTimer()
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(250)
+        self.idle_timer.timeout.connect(self.end_interaction)
+        # optional performance overlay, refreshed once a second
+        self.load_times = OrderedDict()
+        self.upload_pending = False
+        self.hud = PerformanceHUD()
+        self.hud_timer = QTimer()
+        self.hud_timer.setInterval(1000)
+        self.hud_timer.timeout.connect(self.update_hud)
         self.interactor = self.renderer_window.GetInteractor()
-        self.interactor.SetInteractorStyle(None)
+        # the camera is moved by the compiled trackball style, python only
+        # decides which motion a mouse button starts
+        self.interactor_style = vtk.vtkInteractorStyleTrackballCamera()
+        self.interactor_style.AutoAdjustCameraClippingRangeOff()
+        self.interactor.SetInteractorStyle(self.interactor_style)
         self.interactor.SetRenderWindow(self.renderer_window)
+        self.camera_action = None
+        self.pending_move = None
+        # arcs are tessellated again when the zoom changes by a factor of two
+        self.arc_scale = None
+        self.camera.AddObserver('ModifiedEvent', self.camera_modified)
         self.machine = Machine(self.axis)
         self.machine_actor = self.machine.get_actor()
         self.machine_actor.SetCamera(self.camera)
@@ -262,6 +859,9 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
         transform.Translate(*self.g5x_offset[:3])
         transform.RotateZ(self.rotation_offset)
 #        self.axes_actor.SetUserTransform(transform)
+        # paths are opaque by default, alpha blending is much slower on the Pi4
+        self.alpha_blend = False
+        self.path_colors = PathColors()
         self.path_cache = PathCache(self.tooltip_position)
         self.path_cache_actor = self.path_cache.get_actor()
         self.tool = Tool(self.get_tool_array())
@@ -269,6 +869,37 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
         self.offset_axes = OrderedDict()
         self.extents = OrderedDict()
         self.show_extents = bool()
+        # layer inspection, both are evaluated as clipping planes on the gpu
+        self.z_slab = None
+        self.section_planes = list()
+        # segments of a reference program and the diff actors per origin
+        self.reference_segments = None
+        self.program_diffs = OrderedDict()
+        if self.units in ("mm", "metric"):
+            self.diff_quantum = 0.001
+            self.diff_bucket_size = 5.0
+        else:
+            self.diff_quantum = 0.0001
+            self.diff_bucket_size = 0.2
+        # material removal simulation of the loaded program
+        self.stock = None
+        self.stock_surface = None
+        self.stock_transform = None
+        # the last tool tip position cut into the stock while running
+        self.stock_position = None
+        # the program is cut in a spawned pool, a forked worker would inherit
+        # the Qt and GL state, the result is collected by the stock timer
+        self.stock_pool = None
+        self.stock_result = None
+        self.stock_message = None
+        self.stock_timer = QTimer()
+        self.stock_timer.setInterval(100)
+        self.stock_timer.timeout.connect(self.collect_stock)
+        # A axis programs can be shown wrapped around the rotary axis
+        self.rotary_wrap = False
+        # extra placements of the loaded program, as g5x indexes (1 = G54)
+        self.fixture_indexes = list()
+        self.fixture_instances = list()
         self.canon = self.canon_class()
         self.path_actors = self.canon.get_path_actors()
 
@@ -278,7 +909,7 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
             actor_transform = vtk.vtkTransform()
             actor_transform.Translate(*actor_position[:3])
             actor_transform.RotateWXYZ(*actor_position[5:9])
-            actor.SetUserTransform(actor_transform)
+            actor.set_path_transform(actor_transform)
             extents = PathBoundaries(self.camera, actor)
             extents_actor = extents.get_actor()
             axes = actor.get_axes()
@@ -287,21 +918,33 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
             self.renderer.AddActor(axes)
             self.renderer.AddActor(extents_actor)
             self.renderer.AddActor(actor)
-        self.renderer.AddActor(self.tool_actor)
+            for child_actor in actor.get_child_actors():
+                self.renderer.AddActor(child_actor)
+        self.overlay_renderer.AddActor(self.tool_actor)
         self.renderer.AddActor(self.machine_actor)
         self.renderer.AddActor(self.axes_actor)
-        self.renderer.AddActor(self.path_cache_actor)
+        self.overlay_renderer.AddActor(self.path_cache_actor)
+        self.overlay_renderer.AddActor(self.hud.get_actor())
         self.renderer.ResetCamera()
-        self.interactor.AddObserver("LeftButtonPressEvent", self.button_event)
-        self.interactor.AddObserver("LeftButtonReleaseEvent", self.button_event)
-        self.interactor.AddObserver("MiddleButtonPressEvent", self.button_event)
-        self.interactor.AddObserver("MiddleButtonReleaseEvent", self.button_event)
-        self.interactor.AddObserver("RightButtonPressEvent", self.button_event)
-        self.interactor.AddObserver("RightButtonReleaseEvent", self.button_event)
-        self.interactor.AddObserver("MouseMoveEvent", self.mouse_move)
-        self.interactor.AddObserver("KeyPressEvent", self.keypress)
-        self.interactor.AddObserver("MouseWheelForwardEvent", self.mouse_scroll_forward)
-        self.interactor.AddObserver("MouseWheelBackwardEvent", self.mouse_scroll_backward)
+        # Add the observers to watch for particular events. An observer on the
+        # style replaces its default handler, mouse moves are left to the style.
+        style = self.interactor_style
+        style.AddObserver("LeftButtonPressEvent", self.button_event)
+        style.AddObserver("LeftButtonReleaseEvent", self.button_event)
+        style.AddObserver("MiddleButtonPressEvent", self.button_event)
+        style.AddObserver("MiddleButtonReleaseEvent", self.button_event)
+        style.AddObserver("RightButtonPressEvent", self.button_event)
+        style.AddObserver("RightButtonReleaseEvent", self.button_event)
+        style.AddObserver("KeyPressEvent", self.keypress)
+        # the default char handler would quit on 'e' or 'q'
+        style.AddObserver("CharEvent", lambda obj, event: None)
+        style.AddObserver("MouseWheelForwardEvent", self.mouse_scroll_forward)
+        style.AddObserver("MouseWheelBackwardEvent", self.mouse_scroll_backward)
+        self.render_start = 0.0
+        self.frame_time = 0.0
+        self.preview_segments = 0
+        self.renderer_window.AddObserver("StartEvent", self.render_started)
+        self.renderer_window.AddObserver("EndEvent", self.render_finished)
         self.interactor.Initialize()
         self.renderer_window.Render()
 #        self.interactor.Start()
@@ -309,26 +952,26 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
         self._background_color = QColor(10, 10, 10, 255)
         self._background_color2 = QColor(60, 60, 60, 255)
 
-        self.delay = 0
+        self.catch_up = False
         STATUS.connect('file-loaded', lambda w, filename: self.load_program(filename))
         STATUS.connect('motion-mode-changed', lambda w, mode: self.motion_type(mode))
         STATUS.connect('user-system-changed', lambda w, data: self.update_g5x_index(data))
-        STATUS.connect('periodic', self.periodic_check)
+        # the live plot follows the machine on every tab, the offsets are
+        # only checked while the backplot is shown
+        SCHEDULER.register('backplot position', self.periodic_check, PRIORITY_HIGH)
+        SCHEDULER.register('backplot offsets', self.check_offsets, PRIORITY_NORMAL, every=10, widget=self)
         STATUS.connect('tool-in-spindle-changed', lambda w, tool: self.update_tool(tool))
 
         self.line = None
         self._last_filename = str()
 
-        # Add the observers to watch for particular events. These invoke
-        # Python functions.
-        self.rotating = 0
-        self.panning = 0
-        self.zooming = 0
         self.pan_mode = True
 
         if self.lathe is True:
             self.setViewXZ()
 
+        self.update_path_colors()
+
         # view settings
         self.showProgramBounds(True)
         self.showProgramLabels(False)
@@ -338,133 +981,140 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
 
     # Handle the mouse button events.
     def button_event(self, obj, event):
-        if event == "LeftButtonPressEvent":
-            if self.pan_mode is True:
-                self.panning = 1
-            else:
-                self.rotating = 1
-
-        elif event == "LeftButtonReleaseEvent":
-            if self.pan_mode is True:
-                self.panning = 0
-            else:
-                self.rotating = 0
+        style = self.interactor_style
+        if event.endswith("ReleaseEvent"):
+            if self.camera_action == 'rotate':
+                style.EndRotate()
+            elif self.camera_action == 'pan':
+                style.EndPan()
+            elif self.camera_action == 'dolly':
+                style.EndDolly()
+            self.camera_action = None
+            self.idle_timer.start()
+            return
 
+        if event == "LeftButtonPressEvent":
+            action = 'pan' if self.pan_mode is True else 'rotate'
         elif event == "RightButtonPressEvent":
-            if self.pan_mode is True:
-                self.rotating = 1
-            else:
-                self.panning = 1
-
-        elif event == "RightButtonReleaseEvent":
-            if self.pan_mode is True:
-                self.rotating = 0
-            else:
-                self.panning = 0
-
-        elif event == "MiddleButtonPressEvent":
-            self.zooming = 1
-        elif event == "MiddleButtonReleaseEvent":
-            self.zooming = 0
+            action = 'rotate' if self.pan_mode is True else 'pan'
+        else:
+            action = 'dolly'
+        if action == 'rotate' and self.lathe is True:
+            action = 'pan'
+
+        self.begin_interaction()
+        x, y = self.interactor.GetEventPosition()
+        style.FindPokedRenderer(x, y)
+        if style.GetCurrentRenderer() is None:
+            return
+        self.camera_action = action
+        if action == 'rotate':
+            style.StartRotate()
+        elif action == 'pan':
+            style.StartPan()
+        else:
+            style.StartDolly()
+
+    def mouseMoveEvent(self, ev):
+        # Coalesce mouse moves, events that pile up while a frame renders are
+        # dropped and only the latest position is passed on to the style.
+        pending = self.pending_move is not None
+        self.pending_move = QMouseEvent(ev.type(), ev.localPos(), ev.button(),
+                                        ev.buttons(), ev.modifiers())
+        if not pending:
+            QTimer.singleShot(0, self.process_mouse_move)
+
+    def process_mouse_move(self):
+        ev, self.pending_move = self.pending_move, None
+        if ev is not None:
+            QVTKRenderWindowInteractor.mouseMoveEvent(self, ev)
 
     def mouse_scroll_backward(self, obj, event):
+        self.begin_interaction()
         self.zoomOut()
+        self.idle_timer.start()
 
     def mouse_scroll_forward(self, obj, event):
+        self.begin_interaction()
         self.zoomIn()
+        self.idle_timer.start()
+
+    def begin_interaction(self):
+        self.idle_timer.stop()
+        if self.interacting: return
+        self.interacting = True
+        self.static_cache.enabled = False
+        self.renderer_window.SetMultiSamples(0)
+        self.interactive_lod.begin()
+
+    def end_interaction(self):
+        if not self.interacting: return
+        self.interacting = False
+        self.interactive_lod.end()
+        self.renderer_window.SetMultiSamples(self.still_multisamples)
+        self.static_cache.enabled = True
+        self.update_arcs()
+        self.update_render()
 
-    # General high-level logic
-    def mouse_move(self, obj, event):
-        lastXYpos = self.interactor.GetLastEventPosition()
-        lastX = lastXYpos[0]
-        lastY = lastXYpos[1]
-        xypos = self.interactor.GetEventPosition()
-        x = xypos[0]
-        y = xypos[1]
-        center = self.renderer_window.GetSize()
-        centerX = center[0] / 2.0
-        centerY = center[1] / 2.0
-
-        if self.rotating:
-            if self.lathe is True:
-                self.pan(self.renderer, self.camera, x, y, lastX, lastY, centerX, centerY)
-            else:   
-                self.rotate(self.renderer, self.camera, x, y, lastX, lastY, centerX, centerY)
-        elif self.panning:
-            self.pan(self.renderer, self.camera, x, y, lastX, lastY, centerX, centerY)
-        elif self.zooming:
-            self.dolly(self.renderer, self.camera, x, y, lastX, lastY, centerX, centerY)
+    def camera_modified(self, obj, event):
+        # while the mouse moves the camera the arcs are left as they are
+        if not self.interacting:
+            self.update_arcs()
+
+    def update_arcs(self, force=False):
+        height = self.renderer_window.GetSize()[1] or 1
+        if self.camera.GetParallelProjection():
+            view_height = 2.0 * self.camera.GetParallelScale()
+        else:
+            view_height = 2.0 * self.camera.GetDistance() * tan(radians(self.camera.GetViewAngle() / 2.0))
+        scale = int(floor(log(height / max(view_height, 1e-9), 2)))
+        if scale == self.arc_scale and not force:
+            return
+        self.arc_scale = scale
+        tessellated = False
+        for actor in self.path_actors.values():
+            if actor.arcs is not None:
+                actor.arcs.tessellate(2.0 ** (scale + 1))
+                tessellated = True
+        if tessellated:
+            self.interactive_lod.clear()
+
+    def render_started(self, obj, event):
+        self.render_start = time.time()
+
+    def render_finished(self, obj, event):
+        self.frame_time = time.time() - self.render_start
+        TRACER.add('render', 'render', self.render_start, self.frame_time)
+        self.hud.add_frame(self.frame_time)
+        if self.upload_pending:
+            # the first frame after a load sends the new geometry to the gpu
+            self.upload_pending = False
+            self.load_times['upload'] = self.frame_time
+        if self.interacting:
+            self.interactive_lod.adapt(self.frame_time, self.target_frame_time)
 
     def keypress(self, obj, event):
-        key = obj.GetKeySym()
+        key = obj.GetInteractor().GetKeySym()
         if key == "w":
             self.wireframe()
         elif key == "s":
             self.surface()
-
-    # Routines that translate the events into camera motions.
-    # This one is associated with the left mouse button. It translates x
-    # and y relative motions into camera azimuth and elevation commands.
-    def rotate(self, renderer, camera, x, y, lastX, lastY, centerX, centerY):
-        camera.Azimuth(lastX - x)
-        camera.Elevation(lastY - y)
-        camera.OrthogonalizeViewUp()
-        camera.SetClippingRange(self.clipping_range_near, self.clipping_range_far)
-        self.renderer_window.Render()
-        # self.renderer.ResetCamera()
-        self.interactor.ReInitialize()
-
-    # Pan translates x-y motion into translation of the focal point and
-    # position.
-    def pan(self, renderer, camera, x, y, lastX, lastY, centerX, centerY):
-        FPoint = camera.GetFocalPoint()
-        FPoint0 = FPoint[0]
-        FPoint1 = FPoint[1]
-        FPoint2 = FPoint[2]
-        PPoint = camera.GetPosition()
-        PPoint0 = PPoint[0]
-        PPoint1 = PPoint[1]
-        PPoint2 = PPoint[2]
-        renderer.SetWorldPoint(FPoint0, FPoint1, FPoint2, 1.0)
-        renderer.WorldToDisplay()
-        DPoint = renderer.GetDisplayPoint()
-        focalDepth = DPoint[2]
-        APoint0 = centerX + (x - lastX)
-        APoint1 = centerY + (y - lastY)
-        renderer.SetDisplayPoint(APoint0, APoint1, focalDepth)
-        renderer.DisplayToWorld()
-        RPoint = renderer.GetWorldPoint()
-        RPoint0 = RPoint[0]
-        RPoint1 = RPoint[1]
-        RPoint2 = RPoint[2]
-        RPoint3 = RPoint[3]
-
-        if RPoint3 != 0.0:
-            RPoint0 = RPoint0 / RPoint3
-            RPoint1 = RPoint1 / RPoint3
-            RPoint2 = RPoint2 / RPoint3
-
-        camera.SetFocalPoint((FPoint0 - RPoint0) / 1.0 + FPoint0,
-                             (FPoint1 - RPoint1) / 1.0 + FPoint1,
-                             (FPoint2 - RPoint2) / 1.0 + FPoint2)
-
-        camera.SetPosition((FPoint0 - RPoint0) / 1.0 + PPoint0,
-                           (FPoint1 - RPoint1) / 1.0 + PPoint1,
-                           (FPoint2 - RPoint2) / 1.0 + PPoint2)
-
-        self.renderer_window.Render()
-
-    # Dolly converts y-motion into a camera dolly commands.
-    def dolly(self, renderer, camera, x, y, lastX, lastY, centerX, centerY):
-        dollyFactor = pow(1.02, (0.5 * (y - lastY)))
-        if camera.GetParallelProjection():
-            parallelScale = camera.GetParallelScale() * dollyFactor
-            camera.SetParallelScale(parallelScale)
-        else:
-            camera.Dolly(dollyFactor)
-            renderer.ResetCameraClippingRange()
-
-        self.renderer_window.Render()
+        elif key == "h":
+            self.showPerformanceHUD(not self.hud.is_visible())
+        elif key == "r":
+            self.setRotaryWrap(not self.rotary_wrap)
+        elif key == "m":
+            if self.stock is None:
+                self.simulateStock()
+            else:
+                self.clearStock()
+        elif key == "M":
+            # uncut stock, only the running machine removes material
+            self.simulateStock(cut_program=False)
+        elif key == "c":
+            self.addViewSectionPlane()
+        elif key == "C":
+            self.clearSectionPlanes()
 
     # Wireframe sets the representation of all actors to wireframe.
     def wireframe(self):
@@ -474,7 +1124,7 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
         while actor:
             actor.GetProperty().SetRepresentationToWireframe()
             actor = actors.GetNextItem()
-        self.renderer_window.Render()
+        self.update_render()
 
     # Surface sets the representation of all actors to surface.
     def surface(self):
@@ -484,7 +1134,7 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
         while actor:
             actor.GetProperty().SetRepresentationToSurface()
             actor = actors.GetNextItem()
-        self.renderer_window.Render()
+        self.update_render()
 
     def tlo(self, tlo):
         pass
@@ -496,44 +1146,67 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
             self.renderer.RemoveActor(axes)
             self.renderer.RemoveActor(actor)
             self.renderer.RemoveActor(extents)
+            for child_actor in actor.get_child_actors():
+                self.renderer.RemoveActor(child_actor)
         self.path_actors.clear()
         self.offset_axes.clear()
         self.extents.clear()
+        self.interactive_lod.clear()
+        self.load_times.clear()
 
         if fname:
+            start = time.time()
             self.load(fname)
+            self.load_times['parse'] = time.time() - start
         if self.canon is None: return
-        self.canon.draw_lines()
-        self.axes_actor = self.axes.get_actor()
-        self.path_actors = self.canon.get_path_actors()
-        self.renderer.AddActor(self.axes_actor)
+        start = time.time()
+        with TRACER.span('draw_lines', 'load'):
+            self.canon.draw_lines()
+        self.load_times['draw_lines'] = time.time() - start
+        simplification = self.canon.get_simplification()
+        if simplification is not None:
+            self.statusMessage.emit("Preview simplified to fit memory: {}".format(simplification))
+        with TRACER.span('actor setup', 'load'):
+            self.axes_actor = self.axes.get_actor()
+            self.path_actors = self.canon.get_path_actors()
+            self.renderer.AddActor(self.axes_actor)
 
-        for origin, actor in self.path_actors.items():
-            axes = actor.get_axes()
-            index = self.origin_map[origin]
-            path_position = self.g5x_offset
-            path_transform = vtk.vtkTransform()
-            path_transform.Translate(*path_position[:3])
-            path_transform.RotateWXYZ(*path_position[5:9])
-            axes.SetUserTransform(path_transform)
-            actor.SetUserTransform(path_transform)
-            extents = PathBoundaries(self.camera, actor)
-            extents_actor = extents.get_actor()
+            for origin, actor in self.path_actors.items():
+                axes = actor.get_axes()
+                index = self.origin_map[origin]
+                path_position = self.g5x_offset
+                path_transform = vtk.vtkTransform()
+                path_transform.Translate(*path_position[:3])
+                path_transform.RotateWXYZ(*path_position[5:9])
+                actor.set_path_transform(path_transform)
+                actor.set_wrapped(self.rotary_wrap)
+                extents = PathBoundaries(self.camera, actor)
+                extents_actor = extents.get_actor()
 
-            if self.show_extents:
-                extents_actor.XAxisVisibilityOn()
-                extents_actor.YAxisVisibilityOn()
-                extents_actor.ZAxisVisibilityOn()
-            else:
-                extents_actor.XAxisVisibilityOff()
-                extents_actor.YAxisVisibilityOff()
-                extents_actor.ZAxisVisibilityOff()
+                if self.show_extents:
+                    extents_actor.XAxisVisibilityOn()
+                    extents_actor.YAxisVisibilityOn()
+                    extents_actor.ZAxisVisibilityOn()
+                else:
+                    extents_actor.XAxisVisibilityOff()
+                    extents_actor.YAxisVisibilityOff()
+                    extents_actor.ZAxisVisibilityOff()
 
-            self.renderer.AddActor(axes)
-            self.renderer.AddActor(extents_actor)
-            self.renderer.AddActor(actor)
-            self.offset_axes[origin] = axes
-            self.extents[origin] = extents_actor
+                self.renderer.AddActor(axes)
+                self.renderer.AddActor(extents_actor)
+                self.renderer.AddActor(actor)
+                for child_actor in actor.get_child_actors():
+                    self.renderer.AddActor(child_actor)
+                self.offset_axes[origin] = axes
+                self.extents[origin] = extents_actor
+            self.update_arcs(force=True)
+            self.update_diff()
+            self.remove_stock()
+            self.update_path_colors()
+            self.update_fixtures()
+            self.update_clipping()
+        self.preview_segments = sum(actor.get_stats()['segments'] for actor in self.path_actors.values())
+        self.upload_pending = True
         self.update_render()
 
     def motion_type(self, value):
@@ -541,18 +1214,40 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
             self.update_tool()
 
     def update_position(self, position):  # the tool movement
+        self.track_position(position)
+        self.update_tool_transform()
+        self.update_overlay()
+
+    def track_position(self, position):
+        # the cheap part of a position update, also done while hidden
         self.spindle_position = position[:3]
         self.spindle_rotation = position[3:6]
+        tlo = TOOL.GET_TOOL_INFO(self.tool_no)
+        self.tooltip_position = [pos - tlo for pos, tlo in zip(self.spindle_position, tlo[2:5])]
+        self.path_cache.add_line_point(self.tooltip_position)
+        if self.stock is not None:
+            self.cut_stock(self.tooltip_position, tlo[11])
+
+    def cut_stock(self, position, diameter):
+        # the stock is in program coordinates, as the path it was made for
+        position = self.stock_transform.GetInverse().TransformPoint(position)
+        last_position, self.stock_position = self.stock_position, position
+        if last_position is None: return
+        radius = max(diameter / 2.0, self.stock.cell_size)
+        tiles = self.stock.cut_move(last_position, position, radius, self.get_cutter_shape())
+        if tiles:
+            self.stock_surface.update_tiles(tiles)
+            # the stock is part of the static scene, the overlay render that
+            # follows has to draw it again
+            self.static_cache.invalidate()
+
+    def update_tool_transform(self):
         tool_transform = vtk.vtkTransform()
         tool_transform.Translate(*self.spindle_position)
         tool_transform.RotateX(-self.spindle_rotation[0])
         tool_transform.RotateY(-self.spindle_rotation[1])
         tool_transform.RotateZ(-self.spindle_rotation[2])
         self.tool_actor.SetUserTransform(tool_transform)
-        tlo = TOOL.GET_TOOL_INFO(self.tool_no)
-        self.tooltip_position = [pos - tlo for pos, tlo in zip(self.spindle_position, tlo[2:5])]
-        self.path_cache.add_line_point(self.tooltip_position)
-        self.update_render()
 
     def update_g5x_offset(self):
         offset = self.g5x_offset
@@ -565,14 +1260,12 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
             path_index = self.origin_map[origin]
             old_extents = self.extents[origin]
             self.renderer.RemoveActor(old_extents)
-            axes = actor.get_axes()
 
             if path_index == self.g5x_index:
                 path_transform = vtk.vtkTransform()
                 path_transform.Translate(*offset[:3])
                 path_transform.RotateWXYZ(*offset[5:9])
-                axes.SetUserTransform(path_transform)
-                actor.SetUserTransform(path_transform)
+                actor.set_path_transform(path_transform)
             extents = PathBoundaries(self.camera, actor)
             extents_actor = extents.get_actor()
 
@@ -586,6 +1279,9 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
                 extents_actor.ZAxisVisibilityOff()
             self.renderer.AddActor(extents_actor)
             self.extents[origin] = extents_actor
+        self.update_fixtures()
+        self.update_clipping()
+        self.update_diff_transforms()
         self.interactor.ReInitialize()
         self.update_render()
 
@@ -608,12 +1304,10 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
                 # determine change in g92 offset since path was drawn
                 index = self.origin_map[origin] - 1
                 new_path_position = list(map(add, self.g5x_offset[:9], path_offset))
-                axes = actor.get_axes()
                 path_transform = vtk.vtkTransform()
                 path_transform.Translate(*new_path_position[:3])
                 self.axes_actor.SetUserTransform(path_transform)
-                axes.SetUserTransform(path_transform)
-                actor.SetUserTransform(path_transform)
+                actor.set_path_transform(path_transform)
                 extents = PathBoundaries(self.camera, actor)
                 extents_actor = extents.get_actor()
                 if self.show_extents:
@@ -626,27 +1320,45 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
                     extents_actor.ZAxisVisibilityOff()
                 self.renderer.AddActor(extents_actor)
                 self.extents[origin] = extents_actor
+            self.update_clipping()
+            self.update_diff_transforms()
+            self.update_fixtures()
             self.interactor.ReInitialize()
             self.update_render()
 
     def update_tool(self, tool):
         self.tool_no = tool
-        self.renderer.RemoveActor(self.tool_actor)
+        self.overlay_renderer.RemoveActor(self.tool_actor)
         self.tool = Tool(self.get_tool_array())
         self.tool_actor = self.tool.get_actor()
-        tool_transform = vtk.vtkTransform()
-        tool_transform.Translate(*self.spindle_position)
-        tool_transform.RotateX(-self.spindle_rotation[0])
-        tool_transform.RotateY(-self.spindle_rotation[1])
-        tool_transform.RotateZ(-self.spindle_rotation[2])
-        self.tool_actor.SetUserTransform(tool_transform)
-        self.renderer.AddActor(self.tool_actor)
-        self.update_render()
+        self.update_tool_transform()
+        self.overlay_renderer.AddActor(self.tool_actor)
+        self.update_overlay()
 
     def update_render(self):
-#        self.GetRenderWindow().Render()
+        # something in the static scene changed, draw everything
+        self.static_cache.invalidate()
+        if not self.isVisible():
+            self.catch_up = True
+            return
         self.renderer_window.Render()
 
+    def update_overlay(self):
+        # only the tool or live plot changed, the static scene is reused
+        if not self.isVisible():
+            self.catch_up = True
+            return
+        self.renderer_window.Render()
+
+    def showEvent(self, event):
+        super(VTKBackPlot, self).showEvent(event)
+        # one render for everything that happened while hidden
+        if self.catch_up:
+            self.catch_up = False
+            self.update_tool_transform()
+            self.check_offsets(STATUS.stat)
+            self.update_render()
+
     def get_tool_array(self):
         tool_array = {}
         array = TOOL.GET_TOOL_INFO(self.tool_no)
@@ -654,25 +1366,27 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
             tool_array[val] = array[i]
         return tool_array
 
-    def periodic_check(self, w):
-        STATUS.stat.poll()
-        position = STATUS.stat.actual_position
+    def periodic_check(self, stat):
+        # stat was polled by qtvcp for this tick
+        position = stat.actual_position
         if position != self.current_position:
             self.current_position = position
-            self.update_position(position)
-        if self.delay < 9:
-            self.delay += 1
-        else:
-            self.delay = 0
-            g5x_offset = STATUS.stat.g5x_offset
-            g92_offset = STATUS.stat.g92_offset
-            if g5x_offset != self.g5x_offset:
-                self.g5x_offset = g5x_offset
-                self.update_g5x_offset()
-            if g92_offset != self.g92_offset:
-                self.g92_offset = g92_offset
-                self.update_g92_offset()
-        return True
+            if self.isVisible():
+                self.update_position(position)
+            else:
+                # hidden on another tab, only keep the live plot going
+                self.track_position(position)
+                self.catch_up = True
+
+    def check_offsets(self, stat):
+        g5x_offset = stat.g5x_offset
+        g92_offset = stat.g92_offset
+        if g5x_offset != self.g5x_offset:
+            self.g5x_offset = g5x_offset
+            self.update_g5x_offset()
+        if g92_offset != self.g92_offset:
+            self.g92_offset = g92_offset
+            self.update_g92_offset()
 
     def setViewOrtho(self):
         self.camera.ParallelProjectionOn()
@@ -684,49 +1398,29 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
         # self.renderer.ResetCamera()
         self.interactor.ReInitialize()
 
-    def setViewP(self):
-        self.camera.SetPosition(1, -1, 1)
-        self.camera.SetViewUp(0, 0, 1)
+    def setView(self, name):
+        position, view_up, zoom = VIEW_PRESETS[name]
+        self.camera.SetPosition(*position)
+        self.camera.SetViewUp(*view_up)
         self.camera.SetFocalPoint(0, 0, 0)
         self.renderer.ResetCamera()
-        self.camera.Zoom(1.1)
+        self.camera.Zoom(zoom)
         self.interactor.ReInitialize()
 
+    def setViewP(self):
+        self.setView('P')
+
     def setViewX(self):
-        self.camera.SetPosition(1, 0, 0)
-        self.camera.SetViewUp(0, 0, 1)
-        self.camera.SetFocalPoint(0, 0, 0)
-        self.renderer.ResetCamera()
-        # FIXME ugly hack
-        self.camera.Zoom(1.5)
-        self.interactor.ReInitialize()
+        self.setView('X')
 
     def setViewXZ(self):
-        self.camera.SetPosition(0, -1, 0)
-        self.camera.SetViewUp(-1, 0, 0)
-        self.camera.SetFocalPoint(0, 0, 0)
-        self.renderer.ResetCamera()
-        # FIXME ugly hack
-        self.camera.Zoom(1.5)
-        self.interactor.ReInitialize()
+        self.setView('XZ')
 
     def setViewY(self):
-        self.camera.SetPosition(0, -1, 0)
-        self.camera.SetViewUp(0, 0, 1)
-        self.camera.SetFocalPoint(0, 0, 0)
-        self.renderer.ResetCamera()
-        # FIXME ugly hack
-        self.camera.Zoom(1.5)
-        self.interactor.ReInitialize()
+        self.setView('Y')
 
     def setViewZ(self):
-        self.camera.SetPosition(0, 0, 1)
-        self.camera.SetViewUp(0, 1, 0)
-        self.camera.SetFocalPoint(0, 0, 0)
-        self.renderer.ResetCamera()
-        # FIXME ugly hack
-        self.camera.Zoom(2)
-        self.interactor.ReInitialize()
+        self.setView('Z')
 
     def printView(self):
         fp = self.camera.GetFocalPoint()
@@ -743,11 +1437,7 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
         # self.interactor.ReInitialize()
 
     def setViewZ2(self):
-        self.camera.SetPosition(0, 0, 1)
-        self.camera.SetViewUp(1, 0, 0)
-        self.camera.SetFocalPoint(0, 0, 0)
-        self.renderer.ResetCamera()
-        self.interactor.ReInitialize()
+        self.setView('Z2')
 
     def setViewMachine(self):
         self.machine_actor.SetCamera(self.camera)
@@ -767,11 +1457,12 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
         self.interactor.ReInitialize()
 
     def clearLivePlot(self):
-        self.renderer.RemoveActor(self.path_cache_actor)
+        self.overlay_renderer.RemoveActor(self.path_cache_actor)
         self.path_cache = PathCache(self.tooltip_position)
         self.path_cache_actor = self.path_cache.get_actor()
-        self.renderer.AddActor(self.path_cache_actor)
-        self.update_render()
+        self.path_cache.set_alpha_blend(self.alpha_blend, self.get_background())
+        self.overlay_renderer.AddActor(self.path_cache_actor)
+        self.update_overlay()
 
     def enable_panning(self, enabled):
         self.pan_mode = enabled
@@ -796,8 +1487,180 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
             camera.Zoom(1.1)
         self.renderer_window.Render()
 
+    # Z slab and section planes are given in work coordinates of the active
+    # offset. They are set as clipping planes on the path mappers, so moving a
+    # slider only changes a plane equation and no polydata is filtered.
+    def setZSlab(self, zmin, zmax):
+        self.z_slab = (min(zmin, zmax), max(zmin, zmax))
+        self.update_clipping()
+        self.update_render()
+
+    def setZSlabFraction(self, lower, upper):
+        # lower and upper are fractions (0.0 - 1.0) of the program z range
+        bounds = self.get_program_bounds()
+        if bounds is None: return
+        zmin, zmax = bounds[4], bounds[5]
+        height = zmax - zmin
+        self.setZSlab(zmin + height * lower, zmin + height * upper)
+
+    def clearZSlab(self):
+        self.z_slab = None
+        self.update_clipping()
+        self.update_render()
+
+    def addSectionPlane(self, origin, normal):
+        # everything on the side the normal points to is kept, returns False
+        # when the mappers have no clipping plane left
+        if len(self.section_planes) >= MAX_SECTION_PLANES:
+            self.statusMessage.emit("At most {} section planes can be shown".format(MAX_SECTION_PLANES))
+            return False
+        self.section_planes.append((tuple(origin), tuple(normal)))
+        self.update_clipping()
+        self.update_render()
+        return True
+
+    def addViewSectionPlane(self):
+        # through the focal point, the half facing the camera is cut away
+        offset = list(map(add, self.g5x_offset[:3], self.g92_offset[:3]))
+        origin = [point - shift for point, shift in zip(self.camera.GetFocalPoint(), offset)]
+        return self.addSectionPlane(origin, self.camera.GetDirectionOfProjection())
+
+    def clearSectionPlanes(self):
+        self.section_planes = list()
+        self.update_clipping()
+        self.update_render()
+
+    # The program is parsed once and shown at every fixture offset by actors
+    # that share the mappers, and so the gpu buffers, of the original paths.
+    def setFixtures(self, indexes):
+        self.fixture_indexes = [int(index) for index in indexes]
+        self.update_fixtures()
+        self.update_render()
+
+    def clearFixtures(self):
+        self.setFixtures([])
+
+    def update_fixtures(self):
+        for instance in self.fixture_instances:
+            for actor in instance.get_actors():
+                self.renderer.RemoveActor(actor)
+        self.fixture_instances = list()
+        if not self.fixture_indexes: return
+        offsets = self.read_g5x_offsets()
+        for index in self.fixture_indexes:
+            # the active system is already shown by the path actors themselves
+            if index == self.g5x_index or index not in offsets: continue
+            # the g92 offset applies to every system, the one of stat is current
+            offset = offsets[index]
+            transform = vtk.vtkTransform()
+            transform.Translate(*map(add, offset[:3], self.g92_offset[:3]))
+            transform.RotateZ(offset[9])
+            for origin, actor in self.path_actors.items():
+                instance = PathInstance(actor, transform)
+                for instance_actor in instance.get_actors():
+                    self.renderer.AddActor(instance_actor)
+                self.fixture_instances.append(instance)
+
+    def get_program_bounds(self):
+        bounds = None
+        for origin, actor in self.path_actors.items():
+            actor_bounds = actor.get_data_bounds()
+            if actor_bounds is None: continue
+            if bounds is None:
+                bounds = list(actor_bounds)
+            else:
+                bounds[0::2] = map(min, bounds[0::2], actor_bounds[0::2])
+                bounds[1::2] = map(max, bounds[1::2], actor_bounds[1::2])
+        return bounds
+
+    def update_clipping(self):
+        offset = list(map(add, self.g5x_offset[:3], self.g92_offset[:3]))
+        planes = list()
+        if self.z_slab is not None:
+            zmin, zmax = self.z_slab
+            planes.append(((0.0, 0.0, zmin), (0.0, 0.0, 1.0)))
+            planes.append(((0.0, 0.0, zmax), (0.0, 0.0, -1.0)))
+        planes.extend(self.section_planes)
+        clipping_planes = vtk.vtkPlaneCollection()
+        for origin, normal in planes:
+            plane = vtk.vtkPlane()
+            plane.SetOrigin(*map(add, origin, offset))
+            plane.SetNormal(*normal)
+            clipping_planes.AddItem(plane)
+        for origin, actor in self.path_actors.items():
+            for mapper in actor.get_mappers():
+                mapper.SetClippingPlanes(clipping_planes)
+        # the decimated copies hold the old planes
+        self.interactive_lod.clear()
+
     def alphaBlend(self, alpha):
-        pass
+        self.alpha_blend = bool(alpha)
+        if self.alpha_blend:
+            # order independent transparency needs a single geometry pass,
+            # fall back to a few depth peels on older vtk versions
+            if hasattr(self.renderer, 'SetUseOIT'):
+                self.renderer.SetUseDepthPeeling(False)
+                self.renderer.SetUseOIT(True)
+            else:
+                self.renderer.SetUseDepthPeeling(True)
+                self.renderer.SetMaximumNumberOfPeels(4)
+                self.renderer.SetOcclusionRatio(0.1)
+        else:
+            self.renderer.SetUseDepthPeeling(False)
+            if hasattr(self.renderer, 'SetUseOIT'):
+                self.renderer.SetUseOIT(False)
+        self.update_path_colors()
+        self.update_render()
+
+    def get_background(self):
+        background = self.renderer.GetBackground()
+        if self.renderer.GetGradientBackground():
+            background2 = self.renderer.GetBackground2()
+            background = [(b1 + b2) / 2.0 for b1, b2 in zip(background, background2)]
+        return background
+
+    def update_path_colors(self):
+        background = self.get_background()
+        self.path_colors.update(self.alpha_blend, background)
+        for origin, actor in self.path_actors.items():
+            for mapper in actor.get_path_mappers():
+                self.path_colors.apply(mapper)
+            for markers in actor.markers.values():
+                color = blend_color(markers.get_color(), self.alpha_blend, background)
+                markers.get_actor().GetProperty().SetColor(color[:3])
+                markers.get_actor().GetProperty().SetOpacity(color[3])
+        self.path_cache.set_alpha_blend(self.alpha_blend, background)
+
+    def getFrameTime(self):
+        # seconds spent in the last render, to compare the alpha modes
+        return self.frame_time
+
+    def get_perf_counters(self):
+        # the last render in seconds, the load in seconds including the upload
+        # to the gpu, sizes of the preview and live plot
+        return dict(frame_time=self.frame_time,
+                    load_time=sum(self.load_times.values()),
+                    preview_segments=self.preview_segments,
+                    live_plot_points=self.path_cache.index + 1)
+
+    def showPerformanceHUD(self, show):
+        self.hud.set_visible(show)
+        if show:
+            self.hud_timer.start()
+            self.update_hud()
+        else:
+            self.hud_timer.stop()
+            self.update_overlay()
+
+    def update_hud(self):
+        if not self.isVisible(): return
+        stats = OrderedDict()
+        for origin, actor in self.path_actors.items():
+            stats['G{:g}'.format(origin / 10.0)] = actor.get_stats()
+        self.hud.update(stats, self.load_times, self.static_cache.get_memory())
+        self.hud.refreshing = True
+        self.update_overlay()
+        self.hud.refreshing = False
 
     def showProgramBounds(self, show):
         self.show_extents = show
@@ -831,6 +1694,181 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
                     extents.ZAxisLabelVisibilityOff()
         self.update_render()
 
+    def showDirectionArrows(self, show):
+        Markers.show_arrows = show
+        for origin, actor in self.path_actors.items():
+            markers = actor.markers.get('arrow')
+            if markers is not None:
+                markers.get_actor().SetVisibility(show and not actor.wrapped)
+        self.update_fixtures()
+        self.update_render()
+
+    def loadReference(self, fname):
+        # parses another revision of the program to compare the loaded one with
+        if not os.path.isfile(fname):
+            self.statusMessage.emit("Reference program {} not found".format(fname))
+            return False
+        canon = self.canon_class()
+        self.parse(fname, canon)
+        canon.draw_lines()
+        self.reference_segments = OrderedDict(
+            (origin, actor.get_segments()) for origin, actor in canon.get_path_actors().items())
+        self.update_diff()
+        self.update_render()
+        return True
+
+    def clearReference(self):
+        self.reference_segments = None
+        self.update_diff()
+        self.update_render()
+
+    def update_diff(self):
+        for origin, diff in self.program_diffs.items():
+            for actor in diff.get_actors():
+                self.renderer.RemoveActor(actor)
+        self.program_diffs.clear()
+        if self.reference_segments is None: return
+        empty = np.empty((0, 6))
+        added_count = removed_count = region_count = 0
+        for origin in set(self.path_actors.keys()) | set(self.reference_segments.keys()):
+            path_actor = self.path_actors.get(origin)
+            current = path_actor.get_segments() if path_actor is not None else empty
+            reference = self.reference_segments.get(origin, empty)
+            added, removed, cells, classes = program_diff.diff_segments(
+                current, reference, self.diff_quantum, self.diff_bucket_size)
+            if not len(cells): continue
+            diff = ProgramDiff(current[added], reference[removed], cells, classes,
+                               self.diff_bucket_size)
+            for actor in diff.get_actors():
+                self.renderer.AddActor(actor)
+            self.program_diffs[origin] = diff
+            added_count += added.sum()
+            removed_count += removed.sum()
+            region_count += len(cells)
+        self.update_diff_transforms()
+        self.statusMessage.emit("Program diff: {} segments added, {} removed in {} regions".format(
+            added_count, removed_count, region_count))
+
+    def update_diff_transforms(self):
+        # the diff follows the path of its origin, or the active offset
+        # for origins that only the reference program uses
+        for origin, diff in self.program_diffs.items():
+            path_actor = self.path_actors.get(origin)
+            if path_actor is not None:
+                transform = path_actor.GetUserTransform()
+            else:
+                transform = vtk.vtkTransform()
+                transform.Translate(*self.g5x_offset[:3])
+            for actor in diff.get_actors():
+                actor.SetUserTransform(transform)
+
+    def simulateStock(self, top=None, cell_size=None, cut_program=True):
+        # cuts the active path out of a block of stock with the spindle tool,
+        # the machine cuts it further while it runs
+        origin = self.index_map.get(self.g5x_index)
+        path_actor = self.path_actors.get(origin) or next(iter(self.path_actors.values()), None)
+        if path_actor is None: return
+        bounds = path_actor.get_data_bounds()
+        if bounds is None: return
+        start = time.time()
+        tool = self.get_tool_array()
+        if cell_size is None:
+            cell_size = max(bounds[1] - bounds[0], bounds[3] - bounds[2]) / STOCK_RESOLUTION
+            cell_size = max(cell_size, 0.01 if self.units in ("mm", "metric") else 0.0005)
+        radius = max(tool['diameter'] / 2.0, cell_size)
+        shape = self.get_cutter_shape()
+        if top is None:
+            # the usual zero at the top of the stock, else the highest point
+            top = 0.0 if bounds[4] < 0.0 < bounds[5] else bounds[5]
+        margin = radius + 2 * cell_size
+        self.remove_stock()
+        self.stock = Heightfield((bounds[0] - margin, bounds[1] + margin,
+                                  bounds[2] - margin, bounds[3] + margin),
+                                 cell_size, top, bounds[4] - margin)
+        self.stock_surface = StockSurface(self.stock)
+        self.stock_transform = path_actor.GetUserTransform() or vtk.vtkTransform()
+        self.stock_position = None
+        for actor in self.stock_surface.get_actors():
+            actor.SetUserTransform(self.stock_transform)
+            self.renderer.AddActor(actor)
+        message = "Stock simulated with a {} cutter of {} in {{:.1f}} s".format(shape, tool['diameter'])
+        jobs = list()
+        if cut_program:
+            # arcs are followed to half a cell
+            jobs = self.stock.cut_jobs(path_actor.get_segments(cell_size / 2.0), radius, shape)
+        if jobs:
+            self.stock_result = self.get_stock_pool().map_async(erode_job, jobs)
+            self.stock_message = (message, start)
+            self.stock_timer.start()
+            self.statusMessage.emit("Simulating stock ...")
+        else:
+            self.statusMessage.emit(message.format(time.time() - start))
+        self.update_render()
+
+    def get_stock_pool(self):
+        if self.stock_pool is None:
+            context = multiprocessing.get_context('spawn')
+            self.stock_pool = context.Pool(max(1, multiprocessing.cpu_count() - 1))
+        return self.stock_pool
+
+    def collect_stock(self):
+        if self.stock_result is None:
+            self.stock_timer.stop()
+            return
+        if not self.stock_result.ready():
+            return
+        result, self.stock_result = self.stock_result, None
+        self.stock_timer.stop()
+        try:
+            tiles = self.stock.apply_results(result.get())
+        except Exception as e:
+            self.statusMessage.emit("Stock simulation failed: {}".format(e))
+            return
+        self.stock_surface.update_tiles(tiles)
+        message, start = self.stock_message
+        self.statusMessage.emit(message.format(time.time() - start))
+        self.update_render()
+
+    def closeStockPool(self):
+        self.remove_stock()
+        if self.stock_pool is not None:
+            self.stock_pool.terminate()
+            self.stock_pool.join()
+            self.stock_pool = None
+
+    def clearStock(self):
+        self.remove_stock()
+        self.update_render()
+
+    def remove_stock(self):
+        # a pending result is dropped when it comes in
+        self.stock_result = None
+        self.stock_timer.stop()
+        if self.stock_surface is not None:
+            for actor in self.stock_surface.get_actors():
+                self.renderer.RemoveActor(actor)
+        self.stock = None
+        self.stock_surface = None
+        self.stock_transform = None
+        self.stock_position = None
+
+    def get_cutter_shape(self):
+        # the tool table has no shape, ball end mills are named so
+        info = TOOL.GET_TOOL_INFO(self.tool_no)
+        comment = info[15] if len(info) > 15 else ''
+        return 'ball' if 'ball' in str(comment).lower() else 'flat'
+
+    def setRotaryWrap(self, wrap):
+        # switches between the wrapped and flat view of A axis programs
+        self.rotary_wrap = wrap
+        for origin, actor in self.path_actors.items():
+            actor.set_wrapped(wrap)
+            self.extents[origin].SetBounds(actor.get_bounds())
+        self.interactive_lod.clear()
+        self.update_fixtures()
+        self.update_clipping()
+        self.update_render()
+
     def showMachineBounds(self, show):
         if show:
             self.machine_actor.XAxisVisibilityOn()
@@ -861,6 +1899,7 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
     def backgroundColor(self, color):
         self._background_color = color
         self.renderer.SetBackground(color.getRgbF()[:3])
+        self.update_path_colors()
         self.update_render()
 
     @pyqtProperty(QColor)
@@ -872,15 +1911,198 @@ class VTKBackPlot(QVTKRenderWindowInteractor, BaseBackPlot):
         self._background_color2 = color2
         self.renderer.GradientBackgroundOn()
         self.renderer.SetBackground2(color2.getRgbF()[:3])
+        self.update_path_colors()
         self.update_render()
 
+# Keeps the color and depth buffer of the static scene (paths, bounds, axes).
+# While the camera and the scene do not change, the static renderer is switched
+# off and the cached buffers are copied back before the overlay layer draws the
+# tool and the live plot, which then depth test against the static scene.
+class StaticSceneCache:
+    def __init__(self, render_window, static_renderer, overlay_renderer, camera):
+        self.enabled = True
+        self.render_window = render_window
+        self.static_renderer = static_renderer
+        self.size = None
+        self.color = vtk.vtkUnsignedCharArray()
+        self.depth = vtk.vtkFloatArray()
+        overlay_renderer.PreserveColorBufferOn()
+        overlay_renderer.PreserveDepthBufferOn()
+        overlay_renderer.AddObserver('StartEvent', self.overlay_start)
+        render_window.AddObserver('StartEvent', self.window_start)
+        camera.AddObserver('ModifiedEvent', lambda obj, event: self.invalidate())
+
+    def invalidate(self):
+        self.static_renderer.DrawOn()
+
+    def get_memory(self):
+        # bytes held by the cached color and depth buffers
+        return (self.color.GetActualMemorySize() + self.depth.GetActualMemorySize()) * 1024
+
+    def window_start(self, obj, event):
+        if not self.enabled or self.size != tuple(self.render_window.GetSize()):
+            self.invalidate()
+
+    def overlay_start(self, obj, event):
+        if not self.enabled:
+            return
+        width, height = self.render_window.GetSize()
+        if self.static_renderer.GetDraw():
+            # the static scene was drawn in this frame, keep a copy of it
+            self.render_window.GetRGBACharPixelData(0, 0, width - 1, height - 1, 0, self.color)
+            self.render_window.GetZbufferData(0, 0, width - 1, height - 1, self.depth)
+            self.size = (width, height)
+            self.static_renderer.DrawOff()
+        else:
+            self.render_window.SetRGBACharPixelData(0, 0, width - 1, height - 1, self.color, 0)
+            self.render_window.SetZbufferData(0, 0, width - 1, height - 1, self.depth)
+
+
+# Text overlay with frame times, geometry counts, memory and load timings.
+# Frame times are collected on every render, the text is only rebuilt when
+# update is called.
+class PerformanceHUD:
+    def __init__(self):
+        self.frames = 0
+        self.frame_total = 0.0
+        self.frame_max = 0.0
+        self.last_update = time.time()
+        self.refreshing = False
+        self.actor = vtk.vtkTextActor()
+        self.actor.SetDisplayPosition(10, 10)
+        text_property = self.actor.GetTextProperty()
+        text_property.SetFontFamilyToCourier()
+        text_property.SetFontSize(12)
+        text_property.SetColor(yellow)
+        text_property.SetBackgroundColor(0.0, 0.0, 0.0)
+        text_property.SetBackgroundOpacity(0.5)
+        self.actor.VisibilityOff()
+
+    def add_frame(self, frame_time):
+        # the frames that only redraw this text are not counted
+        if self.refreshing: return
+        self.frames += 1
+        self.frame_total += frame_time
+        self.frame_max = max(self.frame_max, frame_time)
+
+    def update(self, stats, load_times, cache_memory):
+        now = time.time()
+        elapsed = max(now - self.last_update, 1e-6)
+        lines = list()
+        if self.frames:
+            lines.append("frame {:7.1f} ms avg {:7.1f} ms max {:6.1f} fps".format(
+                self.frame_total / self.frames * 1000, self.frame_max * 1000,
+                self.frames / elapsed))
+        else:
+            lines.append("frame       - ms avg       - ms max    0.0 fps")
+        cpu_memory = cache_memory
+        gpu_memory = 0
+        for name, stat in stats.items():
+            lines.append("{:<6} {:>9} segments {:>9} points {:>9} cells".format(
+                name, stat['segments'], stat['points'], stat['cells']))
+            cpu_memory += stat['cpu_memory']
+            gpu_memory += stat['gpu_memory']
+        lines.append("memory {:7.1f} MB cpu  ~{:.1f} MB gpu".format(
+            cpu_memory / 1048576.0, gpu_memory / 1048576.0))
+        if load_times:
+            lines.append("load   " + "  ".join("{} {:.2f} s".format(name, seconds)
+                                             for name, seconds in load_times.items()))
+        self.actor.SetInput("\n".join(lines))
+        self.frames = 0
+        self.frame_total = 0.0
+        self.frame_max = 0.0
+        self.last_update = now
+
+    def set_visible(self, show):
+        self.actor.SetVisibility(show)
+        self.last_update = time.time()
+        self.frames = 0
+
+    def is_visible(self):
+        return bool(self.actor.GetVisibility())
+
+    def get_actor(self):
+        return self.actor
+
+
+def estimate_gpu_memory(poly_data):
+    # float xyz per point, two indexes per line and a rgba texel per cell
+    return poly_data.GetNumberOfPoints() * 12 + poly_data.GetNumberOfCells() * 12
+
+
+# Decimated copies of the large path mappers, used while the camera moves.
+# Every stride'th cell is kept, the stride doubles or halves to keep the frame
+# time near the target.
+class InteractiveLOD:
+    def __init__(self, renderer, min_cells=50000, max_stride=64):
+        self.renderer = renderer
+        self.min_cells = min_cells
+        self.max_stride = max_stride
+        self.stride = 2
+        self.lod_mappers = dict()
+        self.swapped = list()
+
+    def begin(self):
+        self.swap()
+
+    def end(self):
+        self.restore()
+
+    def clear(self):
+        self.restore()
+        self.lod_mappers = dict()
+
+    def adapt(self, frame_time, target_frame_time):
+        if frame_time > target_frame_time * 1.25 and self.stride < self.max_stride:
+            self.stride *= 2
+            self.swap()
+        elif frame_time < target_frame_time * 0.5 and self.stride > 1:
+            self.stride //= 2
+            self.swap()
+
+    def swap(self):
+        self.restore()
+        if self.stride <= 1: return
+        actors = self.renderer.GetActors()
+        actors.InitTraversal()
+        actor = actors.GetNextItem()
+        while actor:
+            mapper = actor.GetMapper()
+            if isinstance(mapper, vtk.vtkPolyDataMapper):
+                poly_data = mapper.GetInput()
+                if poly_data is not None and poly_data.GetNumberOfCells() >= self.min_cells:
+                    actor.SetMapper(self.get_lod_mapper(mapper, poly_data))
+                    self.swapped.append((actor, mapper))
+            actor = actors.GetNextItem()
+
+    def restore(self):
+        for actor, mapper in self.swapped:
+            actor.SetMapper(mapper)
+        self.swapped = list()
+
+    def get_lod_mapper(self, mapper, poly_data):
+        key = (mapper, self.stride)
+        lod_mapper = self.lod_mappers.get(key)
+        if lod_mapper is None:
+            mask = vtk.vtkMaskPolyData()
+            mask.SetOnRatio(self.stride)
+            mask.SetInputData(poly_data)
+            mask.Update()
+            lod_mapper = vtk.vtkPolyDataMapper()
+            # keeps the lookup table, scalar mode and clipping planes
+            lod_mapper.ShallowCopy(mapper)
+            lod_mapper.SetInputData(mask.GetOutput())
+            self.lod_mappers[key] = lod_mapper
+        return lod_mapper
+
+
 # this draws the program boundary outline
 class PathBoundaries:
     show_program_bounds = bool()
     show_program_labels = bool()
     def __init__(self, camera, path_actor):
         self.path_actor = path_actor
-        bounds = self.path_actor.GetBounds()
+        bounds = self.path_actor.get_bounds()
         cube_axes_actor = vtk.vtkCubeAxesActor()
         cube_axes_actor.SetBounds(bounds)
         cube_axes_actor.SetCamera(camera)
@@ -943,6 +2165,11 @@ class PathCache:
         self.polygon_mapper.SetInputData(self.lines_polygon_data)
         self.polygon_mapper.Update()
 
+    def set_alpha_blend(self, alpha_blend, background):
+        color = blend_color([255 * c for c in yellow] + [128], alpha_blend, background)
+        self.actor.GetProperty().SetColor(color[:3])
+        self.actor.GetProperty().SetOpacity(color[3])
+
     def add_line_point(self, point):
         self.index += 1
         self.points.InsertNextPoint(point)
@@ -956,6 +2183,458 @@ class PathCache:
         return self.actor
 
 
+def compose_transform(transform, translation=None):
+    # translate first, then apply transform
+    if translation is None:
+        return transform
+    composed = vtk.vtkTransform()
+    if transform is not None:
+        composed.Concatenate(transform)
+    composed.Translate(*translation)
+    return composed
+
+
+# one unique run of segments that occurs several times in a program, drawn
+# once per occurrence by actors sharing a single mapper
+class PathBlock:
+    def __init__(self, translations):
+        self.translations = translations
+        self.colors = vtk.vtkUnsignedCharArray()
+        self.colors.SetNumberOfComponents(1)
+        self.points = vtk.vtkPoints()
+        self.lines = vtk.vtkCellArray()
+        self.poly_data = vtk.vtkPolyData()
+        self.data_mapper = vtk.vtkPolyDataMapper()
+        self.actors = list()
+        for translation in translations:
+            actor = vtk.vtkActor()
+            actor.SetMapper(self.data_mapper)
+            self.actors.append(actor)
+
+    def update(self):
+        self.poly_data.SetPoints(self.points)
+        self.poly_data.SetLines(self.lines)
+        self.poly_data.GetCellData().SetScalars(self.colors)
+        self.data_mapper.SetInputData(self.poly_data)
+        self.data_mapper.Update()
+
+    def set_path_transform(self, transform):
+        for translation, actor in zip(self.translations, self.actors):
+            actor.SetUserTransform(compose_transform(transform, translation))
+
+    def get_instances(self):
+        return list(zip(self.actors, self.translations))
+
+    def get_actors(self):
+        return self.actors
+
+
+def poly_data_segments(poly_data):
+    # the two point cells of a path poly data as segment rows
+    if not poly_data.GetNumberOfCells():
+        return np.empty((0, 6))
+    points = numpy_support.vtk_to_numpy(poly_data.GetPoints().GetData())
+    cells = numpy_support.vtk_to_numpy(poly_data.GetLines().GetData()).reshape(-1, 3)
+    return np.hstack([points[cells[:, 1]], points[cells[:, 2]]])
+
+
+def wrap_points(points, angles):
+    # turn points around the X axis by their A angle in degrees
+    theta = np.radians(angles) * ROTARY_SIGN
+    cos_theta, sin_theta = np.cos(theta), np.sin(theta)
+    wrapped = points.copy()
+    wrapped[:, 1] = points[:, 1] * cos_theta - points[:, 2] * sin_theta
+    wrapped[:, 2] = points[:, 1] * sin_theta + points[:, 2] * cos_theta
+    return wrapped
+
+
+def polyline_cells(sizes):
+    # one polyline cell per size, in the legacy count and ids layout
+    first = np.cumsum(sizes) - sizes
+    connectivity = np.insert(np.arange(int(sizes.sum())), first, sizes)
+    lines = vtk.vtkCellArray()
+    lines.SetCells(len(sizes), numpy_support.numpy_to_vtkIdTypeArray(
+        connectivity.astype(numpy_support.get_vtk_to_numpy_typemap()[vtk.VTK_ID_TYPE]), deep=True))
+    return lines
+
+
+# The segments of a path with A motion wrapped onto the cylinder around X.
+# Segments that turn A are split into pieces of at most ROTARY_STEP degrees.
+class RotaryPath:
+    def __init__(self, segments, types):
+        count = len(segments)
+        starts, ends = segments[:, 0:4], segments[:, 4:8]
+        steps = np.maximum(1, np.ceil(np.abs(ends[:, 3] - starts[:, 3]) / ROTARY_STEP)).astype(int)
+        sizes = steps + 1
+        first = np.cumsum(sizes) - sizes
+        segment = np.repeat(np.arange(count), sizes)
+        fraction = (np.arange(int(sizes.sum())) - first[segment]) / steps[segment].astype(float)
+        points = starts[segment] + fraction[:, None] * (ends - starts)[segment]
+
+        vtk_points = vtk.vtkPoints()
+        vtk_points.SetData(numpy_support.numpy_to_vtk(
+            wrap_points(points[:, 0:3], points[:, 3]), deep=True))
+        colors = numpy_support.numpy_to_vtk(types, deep=True, array_type=vtk.VTK_UNSIGNED_CHAR)
+        self.poly_data = vtk.vtkPolyData()
+        self.poly_data.SetPoints(vtk_points)
+        self.poly_data.SetLines(polyline_cells(sizes))
+        self.poly_data.GetCellData().SetScalars(colors)
+
+
+# All arcs of one path, kept as records and tessellated for the size they
+# have on screen. The records are columns of a numpy array: plane,
+# center (2), radius at start and end, start angle, sweep, start (3), end (3),
+# A at start and end
+class ArcPaths:
+    def __init__(self, arcs, max_division=64, tolerance=0.5, max_points=2000000):
+        self.records = np.array(arcs, dtype=float)
+        # at most max_division segments per half turn, like the parser
+        self.max_division = max_division
+        # chord error in pixels
+        self.tolerance = tolerance
+        self.max_points = max_points
+        self.wrapped = False
+        self.pixels_per_unit = 8.0
+        self.poly_data = vtk.vtkPolyData()
+        self.data_mapper = vtk.vtkPolyDataMapper()
+        self.data_mapper.SetInputData(self.poly_data)
+        self.actor = vtk.vtkActor()
+        self.actor.SetMapper(self.data_mapper)
+        self.tessellate(self.pixels_per_unit)
+
+    def set_wrapped(self, wrapped):
+        self.wrapped = wrapped
+        self.tessellate(self.pixels_per_unit)
+
+    def tessellate(self, pixels_per_unit):
+        self.pixels_per_unit = pixels_per_unit
+        points, sizes = self.get_points(pixels_per_unit, self.wrapped)
+        vtk_points = vtk.vtkPoints()
+        vtk_points.SetData(numpy_support.numpy_to_vtk(points, deep=True))
+        lines = polyline_cells(sizes)
+        colors = numpy_support.numpy_to_vtk(
+            np.full(len(sizes), LINE_TYPES.index('arcfeed'), dtype=np.uint8),
+            deep=True, array_type=vtk.VTK_UNSIGNED_CHAR)
+        self.poly_data.SetPoints(vtk_points)
+        self.poly_data.SetLines(lines)
+        self.poly_data.GetCellData().SetScalars(colors)
+        self.poly_data.Modified()
+
+    def get_segments(self, chord_error):
+        # the unwrapped arcs as segment rows, no further off than chord_error
+        points, sizes = self.get_points(self.tolerance / chord_error, False)
+        last = np.cumsum(sizes) - 1
+        starts = np.setdiff1d(np.arange(len(points) - 1), last)
+        return np.hstack([points[starts], points[starts + 1]])
+
+    def get_points(self, pixels_per_unit, wrapped):
+        # the points of all arcs and the number of points of each arc
+        records = self.records
+        count = len(records)
+        planes = records[:, 0].astype(int)
+        center_u, center_v = records[:, 1], records[:, 2]
+        radius1, radius2 = records[:, 3], records[:, 4]
+        theta1, sweep = records[:, 5], records[:, 6]
+        starts, ends = records[:, 7:10], records[:, 10:13]
+
+        # segments for the chord error, between a quarter turn and the
+        # parser resolution
+        radius = np.maximum(np.maximum(radius1, radius2) * pixels_per_unit, 1e-9)
+        step_angle = np.sqrt(8.0 * self.tolerance / radius)
+        lower = np.ceil(np.abs(sweep) / (pi / 2))
+        upper = np.maximum(3, np.floor(self.max_division * np.abs(sweep) / pi))
+        steps = np.clip(np.ceil(np.abs(sweep) / step_angle), lower, upper)
+        if wrapped:
+            turn = np.abs(records[:, 14] - records[:, 13])
+            steps = np.maximum(steps, np.ceil(turn / ROTARY_STEP))
+        if steps.sum() + count > self.max_points:
+            steps = np.maximum(lower, np.floor(steps * (self.max_points - count) / steps.sum()))
+        steps = steps.astype(int)
+
+        sizes = steps + 1
+        total = int(sizes.sum())
+        first = np.cumsum(sizes) - sizes
+        arc = np.repeat(np.arange(count), sizes)
+        fraction = (np.arange(total) - first[arc]) / steps[arc].astype(float)
+        angle = theta1[arc] + fraction * sweep[arc]
+        distance = radius1[arc] + fraction * (radius2 - radius1)[arc]
+
+        axes = np.array([ARC_PLANE_AXES[plane] for plane in (1, 2, 3)])[planes - 1]
+        rows = np.arange(total)
+        axial = axes[:, 2]
+        points = np.empty((total, 3))
+        points[rows, axes[arc, 0]] = center_u[arc] + distance * np.cos(angle)
+        points[rows, axes[arc, 1]] = center_v[arc] + distance * np.sin(angle)
+        points[rows, axial[arc]] = (starts[arc, axial[arc]]
+                                    + fraction * (ends - starts)[arc, axial[arc]])
+        # the ends are exact, also for arcs that are a little off center
+        points[first] = starts
+        points[first + steps] = ends
+        if wrapped:
+            turn = records[:, 13][arc] + fraction * (records[:, 14] - records[:, 13])[arc]
+            points = wrap_points(points, turn)
+        return points, sizes
+
+    def get_chords(self):
+        # start to middle and middle to end of every arc, for comparing
+        records = self.records
+        angle = records[:, 5] + records[:, 6] / 2.0
+        radius = (records[:, 3] + records[:, 4]) / 2.0
+        axes = np.array([ARC_PLANE_AXES[plane] for plane in (1, 2, 3)])[records[:, 0].astype(int) - 1]
+        rows = np.arange(len(records))
+        starts, ends = records[:, 7:10], records[:, 10:13]
+        middle = np.empty((len(records), 3))
+        middle[rows, axes[:, 0]] = records[:, 1] + radius * np.cos(angle)
+        middle[rows, axes[:, 1]] = records[:, 2] + radius * np.sin(angle)
+        middle[rows, axes[:, 2]] = (starts[rows, axes[:, 2]] + ends[rows, axes[:, 2]]) / 2.0
+        return np.vstack([np.hstack([starts, middle]), np.hstack([middle, ends])])
+
+    def get_actor(self):
+        return self.actor
+
+
+# The simulated stock, one image data surface per tile of the heightfield.
+# Tiles share their edge row and column with the next tile to leave no gaps.
+class StockSurface:
+    def __init__(self, heightfield):
+        self.heightfield = heightfield
+        self.tiles = dict()
+        for tile in heightfield.get_tiles():
+            rows, columns = self.get_region(tile)
+            heights = np.ascontiguousarray(heightfield.heights[rows, columns])
+            scalars = numpy_support.numpy_to_vtk(heights.ravel(), deep=False)
+            image = vtk.vtkImageData()
+            image.SetDimensions(heights.shape[1], heights.shape[0], 1)
+            image.SetOrigin(heightfield.origin[0] + columns.start * heightfield.cell_size,
+                            heightfield.origin[1] + rows.start * heightfield.cell_size, 0.0)
+            image.SetSpacing(heightfield.cell_size, heightfield.cell_size, 1.0)
+            image.GetPointData().SetScalars(scalars)
+            geometry = vtk.vtkImageDataGeometryFilter()
+            geometry.SetInputData(image)
+            warp = vtk.vtkWarpScalar()
+            warp.SetInputConnection(geometry.GetOutputPort())
+            warp.UseNormalOn()
+            warp.SetNormal(0.0, 0.0, 1.0)
+            mapper = vtk.vtkPolyDataMapper()
+            mapper.SetInputConnection(warp.GetOutputPort())
+            mapper.ScalarVisibilityOff()
+            actor = vtk.vtkActor()
+            actor.SetMapper(mapper)
+            actor.GetProperty().SetColor([c / 255.0 for c in STOCK_COLOR])
+            # the numpy array backs the vtk scalars and has to stay alive
+            self.tiles[tile] = (heights, scalars, image, actor)
+
+    def get_region(self, tile):
+        row, column = tile
+        heightfield = self.heightfield
+        return (slice(row, min(row + TILE_SIZE + 1, heightfield.rows)),
+                slice(column, min(column + TILE_SIZE + 1, heightfield.columns)))
+
+    def update_tiles(self, tiles):
+        # copies the new heights of changed tiles and of the neighbours that
+        # share an edge with them, only their pipelines run and upload again
+        changed = set()
+        for row, column in tiles:
+            for neighbour in ((row, column), (row - TILE_SIZE, column), (row, column - TILE_SIZE),
+                              (row - TILE_SIZE, column - TILE_SIZE)):
+                if neighbour in self.tiles:
+                    changed.add(neighbour)
+        for tile in changed:
+            heights, scalars, image, actor = self.tiles[tile]
+            rows, columns = self.get_region(tile)
+            heights[:] = self.heightfield.heights[rows, columns]
+            scalars.Modified()
+            image.Modified()
+
+    def get_actors(self):
+        return [actor for heights, scalars, image, actor in self.tiles.values()]
+
+
+# Differences to a reference program: the added and removed segments and a
+# box around every bucket that changed, colored by DIFF_COLORS
+class ProgramDiff:
+    def __init__(self, added, removed, cells, classes, bucket_size):
+        lookup_table = vtk.vtkLookupTable()
+        lookup_table.SetNumberOfTableValues(len(DIFF_COLORS))
+        lookup_table.SetTableRange(0, len(DIFF_COLORS) - 1)
+        lookup_table.Build()
+        for index, color in enumerate(DIFF_COLORS):
+            lookup_table.SetTableValue(index, *[c / 255.0 for c in color])
+
+        segments = np.vstack([added, removed])
+        segment_classes = np.repeat([program_diff.ADDED, program_diff.REMOVED],
+                                    [len(added), len(removed)]).astype(np.uint8)
+        self.segment_actor = self.build_actor(segments, segment_classes, lookup_table)
+        self.segment_actor.GetProperty().SetLineWidth(2)
+
+        # the 12 edges of the bucket cubes
+        corners = np.array([(x, y, z) for z in (0, 1) for y in (0, 1) for x in (0, 1)], dtype=float)
+        edges = np.array([(0, 1), (2, 3), (4, 5), (6, 7), (0, 2), (1, 3),
+                          (4, 6), (5, 7), (0, 4), (1, 5), (2, 6), (3, 7)])
+        boxes = (cells[:, None, :] + corners[None, :, :]) * bucket_size
+        box_segments = np.concatenate([boxes[:, edges[:, 0]], boxes[:, edges[:, 1]]], axis=2)
+        self.box_actor = self.build_actor(box_segments.reshape(-1, 6), np.repeat(classes, 12),
+                                          lookup_table)
+        self.box_actor.GetProperty().SetOpacity(0.5)
+
+    def build_actor(self, segments, classes, lookup_table):
+        points = vtk.vtkPoints()
+        points.SetData(numpy_support.numpy_to_vtk(
+            np.ascontiguousarray(segments.reshape(-1, 3)), deep=True))
+        poly_data = vtk.vtkPolyData()
+        poly_data.SetPoints(points)
+        poly_data.SetLines(polyline_cells(np.full(len(segments), 2)))
+        poly_data.GetCellData().SetScalars(numpy_support.numpy_to_vtk(
+            classes, deep=True, array_type=vtk.VTK_UNSIGNED_CHAR))
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(poly_data)
+        mapper.SetLookupTable(lookup_table)
+        mapper.UseLookupTableScalarRangeOn()
+        mapper.SetScalarModeToUseCellData()
+        mapper.SetColorModeToMapScalars()
+        actor = vtk.vtkActor()
+        actor.SetMapper(mapper)
+        return actor
+
+    def get_actors(self):
+        return [self.segment_actor, self.box_actor]
+
+
+# an extra placement of a path actor, sharing its mappers and properties
+class PathInstance:
+    def __init__(self, path_actor, transform):
+        self.actors = list()
+        for source, translation in path_actor.get_instance_sources():
+            actor = vtk.vtkActor()
+            actor.SetMapper(source.GetMapper())
+            actor.SetProperty(source.GetProperty())
+            actor.SetVisibility(source.GetVisibility())
+            actor.SetUserTransform(compose_transform(transform, translation))
+            self.actors.append(actor)
+
+    def get_actors(self):
+        return self.actors
+
+
+# this draws all event markers of one kind with a single instanced glyph mapper
+class Markers:
+    show_arrows = bool()
+    def __init__(self, kind, markers, color):
+        self.kind = kind
+        if MACHINE_UNITS in ("mm", "metric"):
+            self.size = 1.0
+        else:
+            self.size = 0.04
+
+        points = vtk.vtkPoints()
+        directions = vtk.vtkDoubleArray()
+        directions.SetName('direction')
+        directions.SetNumberOfComponents(3)
+        for point, direction in markers:
+            points.InsertNextPoint(point)
+            directions.InsertNextTuple(direction or (0.0, 0.0, 1.0))
+        self.poly_data = vtk.vtkPolyData()
+        self.poly_data.SetPoints(points)
+        self.poly_data.GetPointData().AddArray(directions)
+
+        if kind == 'dwell':
+            source = vtk.vtkSphereSource()
+            source.SetRadius(self.size)
+            source.SetThetaResolution(12)
+            source.SetPhiResolution(12)
+        elif kind == 'toolchange':
+            source = vtk.vtkCubeSource()
+            source.SetXLength(self.size * 2)
+            source.SetYLength(self.size * 2)
+            source.SetZLength(self.size * 2)
+        elif kind == 'hole':
+            # flat disc in the XY plane
+            cylinder = vtk.vtkCylinderSource()
+            cylinder.SetRadius(self.size)
+            cylinder.SetHeight(self.size / 10)
+            cylinder.SetResolution(16)
+            transform = vtk.vtkTransform()
+            transform.RotateX(90)
+            source = vtk.vtkTransformPolyDataFilter()
+            source.SetTransform(transform)
+            source.SetInputConnection(cylinder.GetOutputPort())
+        elif kind == 'arrow':
+            source = vtk.vtkArrowSource()
+            source.SetTipLength(0.5)
+            source.SetTipRadius(0.2)
+            source.SetShaftRadius(0.05)
+        else:
+            source = vtk.vtkConeSource()
+            source.SetHeight(self.size * 2)
+            source.SetRadius(self.size)
+            source.SetDirection(0, 0, -1)
+            source.SetResolution(12)
+
+        self.mapper = vtk.vtkGlyph3DMapper()
+        self.mapper.SetInputData(self.poly_data)
+        self.mapper.SetSourceConnection(source.GetOutputPort())
+        self.mapper.ScalarVisibilityOff()
+        if kind == 'arrow':
+            self.mapper.SetScaleModeToNoDataScaling()
+            self.mapper.SetScaleFactor(self.size * 3)
+            self.mapper.SetOrientationArray('direction')
+            self.mapper.SetOrientationModeToDirection()
+        else:
+            self.mapper.ScalingOff()
+            self.mapper.OrientOff()
+
+        self.color = color
+        self.actor = vtk.vtkActor()
+        self.actor.SetMapper(self.mapper)
+        self.actor.GetProperty().SetColor([c / 255.0 for c in color[:3]])
+        self.actor.GetProperty().SetOpacity(color[3] / 255.0)
+        if kind == 'arrow':
+            self.actor.SetVisibility(Markers.show_arrows)
+
+    def get_mapper(self):
+        return self.mapper
+
+    def get_color(self):
+        return self.color
+
+    def get_actor(self):
+        return self.actor
+
+
+# Maps line types to colors for all path mappers. In opaque mode the alpha of
+# each color is baked into the rgb against the background, so all paths are
+# drawn in the opaque pass without any blending or sorting.
+class PathColors:
+    def __init__(self, colors=COLOR_MAP):
+        self.colors = colors
+        self.lookup_table = vtk.vtkLookupTable()
+        self.lookup_table.SetNumberOfTableValues(len(LINE_TYPES))
+        self.lookup_table.SetTableRange(0, len(LINE_TYPES) - 1)
+        self.lookup_table.Build()
+
+    def update(self, alpha_blend, background):
+        for index, line_type in enumerate(LINE_TYPES):
+            self.lookup_table.SetTableValue(index, *blend_color(self.colors[line_type],
+                                                                alpha_blend, background))
+        self.lookup_table.Modified()
+
+    def apply(self, mapper):
+        mapper.SetLookupTable(self.lookup_table)
+        mapper.UseLookupTableScalarRangeOn()
+        mapper.SetScalarModeToUseCellData()
+        mapper.SetColorModeToMapScalars()
+        mapper.ScalarVisibilityOn()
+
+
+def blend_color(color, alpha_blend, background):
+    # color is rgba 0 - 255, returns rgba 0.0 - 1.0
+    rgb = [c / 255.0 for c in color[:3]]
+    alpha = color[3] / 255.0
+    if alpha_blend:
+        return rgb + [alpha]
+    return [alpha * c + (1.0 - alpha) * b for c, b in zip(rgb, background)] + [1.0]
+
+
 # this draws the machine boundary outline
 class Machine:
     def __init__(self, axis):